@@ -1,8 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 import os
 import logging
@@ -16,6 +19,16 @@ import jwt
 from enum import Enum
 import subprocess
 import json
+import re
+import time
+import asyncio
+import hashlib
+import socket
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -30,10 +43,49 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Alert storm suppression: repeats of the same (alert_type, entity_type, entity_id)
+# inside this window are counted in memory and flushed with the next write
+ALERT_MIN_INTERVAL_SECONDS = float(os.environ.get('ALERT_MIN_INTERVAL_SECONDS', '30'))
+
+# Business config snapshots: maximum long-poll wait, and how often a worker
+# re-checks the shared version counter for changes made by other workers
+BUSINESS_CONFIG_MAX_WAIT_SECONDS = 60
+BUSINESS_CONFIG_VERSION_CHECK_SECONDS = 1.0
+BUSINESS_CONFIG_CHANGE_RETENTION = 1000  # versions kept for delta responses
+SWITCH_NODE_BUNDLE_CHANGE_RETENTION = 1000  # per switch node
+SWITCH_NODE_BUNDLE_RECONCILE_ATTEMPTS = 5
+
 # Git Repository Path
 GIT_REPO_PATH = ROOT_DIR.parent / "git_configs"
 GIT_REPO_PATH.mkdir(exist_ok=True)
 
+# Hot read endpoints: concurrent identical requests share one computation and
+# the result is reused for this long unless a write path invalidates it first
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '2'))
+
+# Git writer lease: only the worker holding the lease touches the working tree;
+# every worker enqueues git jobs in Mongo for it to run in order.
+# GIT_REPO_PATH is local to each host, so unless it is on a volume shared by
+# every host (GIT_REPO_SHARED=true) the repository is pinned to one host: the
+# first to take the lease, or GIT_REPO_HOST. Only workers on that host may take
+# the lease, so history never forks on failover. To move the repository, copy
+# the tree to the new host and restart with GIT_REPO_HOST set to it.
+HOSTNAME = socket.gethostname()
+WORKER_ID = f"{HOSTNAME}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+GIT_REPO_SHARED = os.environ.get('GIT_REPO_SHARED', 'false').lower() == 'true'
+GIT_REPO_HOST = os.environ.get('GIT_REPO_HOST')
+GIT_LEASE_TTL_SECONDS = 30
+GIT_WRITER_POLL_SECONDS = 1.0
+GIT_JOB_WAIT_SECONDS = 60
+GIT_JOB_RETENTION_HOURS = 24  # finished jobs are pruned after this
+# Reads never queue behind writes: workers on the repository host read the tree
+# directly, others forward the request to the lease holder at the URL it
+# advertises (GIT_READ_URL, the base URL other hosts reach this worker on).
+GIT_READ_URL = os.environ.get('GIT_READ_URL')
+GIT_READ_TIMEOUT_SECONDS = 10
+GIT_READ_PROXY_HEADER = "X-Git-Read-Proxied"
+GIT_FILES_MAX_BYTES = int(os.environ.get('GIT_FILES_MAX_BYTES', str(8 * 1024 * 1024)))
+
 # Create the main app
 app = FastAPI(title="Toolbox Network Scheme Manager")
 api_router = APIRouter(prefix="/api")
@@ -189,9 +241,25 @@ class Alert(BaseModel):
     message: str
     severity: str = "medium"  # low, medium, high, critical
     is_resolved: bool = False
+    occurrence_count: int = 1
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    first_seen_at: Optional[datetime] = None
+    last_seen_at: Optional[datetime] = None
     resolved_at: Optional[datetime] = None
 
+class AlertCreate(BaseModel):
+    alert_type: AlertType
+    entity_type: str
+    entity_id: str
+    message: str
+    severity: str = "medium"
+
+class AlertResolveFilter(BaseModel):
+    alert_ids: Optional[List[str]] = None
+    alert_type: Optional[AlertType] = None
+    entity_type: Optional[str] = None
+    entity_id: Optional[str] = None
+
 class Threshold(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -211,6 +279,11 @@ class ThresholdCreate(BaseModel):
     comparison: str
     entity_type: str
 
+class ProfilingRequest(BaseModel):
+    route_pattern: str  # regex searched against the request path
+    requests: int = Field(default=1, ge=1, le=100)
+    interval_ms: float = Field(default=5.0, ge=1.0, le=1000.0)
+
 class BusinessConfig(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -282,6 +355,533 @@ async def log_audit(entity_type: str, entity_id: str, action: str, user: Dict,
     doc['timestamp'] = doc['timestamp'].isoformat()
     await db.audit_trail.insert_one(doc)
 
+# Single-flight read cache, per worker: (scope, *key) -> (expires_at, value)
+_response_cache: Dict[tuple, tuple] = {}
+_response_inflight: Dict[tuple, asyncio.Task] = {}
+_response_cache_generation: Dict[str, int] = {}
+
+async def cached_read(scope: str, key: tuple, compute):
+    """Return compute() for this key, sharing in-flight work and recent results.
+
+    ``scope`` names the data the result depends on so write paths can drop it
+    with invalidate_cached_reads().
+    """
+    full_key = (scope,) + key
+    cached = _response_cache.get(full_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    task = _response_inflight.get(full_key)
+    if task is None:
+        generation = _response_cache_generation.get(scope, 0)
+        task = asyncio.ensure_future(compute())
+        _response_inflight[full_key] = task
+        
+        def _finish(done: asyncio.Task):
+            if _response_inflight.get(full_key) is done:
+                del _response_inflight[full_key]
+            if done.cancelled() or done.exception() is not None:
+                return
+            if _response_cache_generation.get(scope, 0) == generation:
+                _response_cache[full_key] = (time.monotonic() + RESPONSE_CACHE_TTL_SECONDS, done.result())
+        
+        task.add_done_callback(_finish)
+    
+    # Shield so one disconnecting client does not cancel the work for the others
+    return await asyncio.shield(task)
+
+def invalidate_cached_reads(*scopes: str):
+    for scope in scopes:
+        _response_cache_generation[scope] = _response_cache_generation.get(scope, 0) + 1
+        for full_key in [k for k in _response_cache if k[0] == scope]:
+            del _response_cache[full_key]
+        for full_key in [k for k in _response_inflight if k[0] == scope]:
+            del _response_inflight[full_key]
+
+# Endpoint bindings in use, shared by all workers: one endpoint_bindings document
+# per (ip_address, port), unique, holding the entity that owns it and the
+# registrations reserving it. Registrations are "connection:<id>" for applied
+# connections and "pending:<change_id>" for outstanding pending changes; the
+# entity key lets an update reuse the bindings of the connection it replaces.
+# reserved_at records when each registration was added: workers reserve before
+# inserting the pending change, so a registration with no owner yet is only
+# pruned once it is older than the grace period.
+ENDPOINT_BINDING_GRACE_SECONDS = 300
+
+def _connection_bindings(data: Dict) -> List[tuple]:
+    bindings = [(data["client_ip_address"], int(data["client_port"]))]
+    for node in data.get("connector_nodes") or []:
+        bindings.append((node["ip_address"], int(node["port"])))
+    return bindings
+
+def _duplicate_bindings(bindings: List[tuple], used_by: str = "same submission") -> List[Dict]:
+    seen = set()
+    conflicts = []
+    for ip, port in bindings:
+        if (ip, port) in seen:
+            conflicts.append({"ip_address": ip, "port": port, "used_by": used_by})
+        seen.add((ip, port))
+    return conflicts
+
+def _import_file_conflicts(entries: List[Dict]) -> Dict[int, List[Dict]]:
+    """Bindings repeated within one import file, keyed by the position of the later entry."""
+    conflicts: Dict[int, List[Dict]] = {}
+    first_use: Dict[tuple, int] = {}
+    for position, data in enumerate(entries):
+        bindings = _connection_bindings(data)
+        found = _duplicate_bindings(bindings)
+        for binding in dict.fromkeys(bindings):
+            if binding in first_use:
+                found.append({"ip_address": binding[0], "port": binding[1],
+                              "used_by": f"import entry {first_use[binding]}"})
+            else:
+                first_use[binding] = position
+        if found:
+            conflicts[position] = found
+    return conflicts
+
+async def _reserve_binding(ip: str, port: int, registration_id: str, entity_key: str) -> Optional[bool]:
+    """Add a registration to one binding. True if added, False if already held, None on conflict."""
+    now = datetime.now(timezone.utc).isoformat()
+    for _ in range(3):
+        try:
+            await db.endpoint_bindings.insert_one({
+                "ip_address": ip, "port": port, "entity_key": entity_key,
+                "registrations": [registration_id], "reserved_at": {registration_id: now}
+            })
+            return True
+        except DuplicateKeyError:
+            pass
+        # Same entity, or a binding whose last registration is being removed
+        before = await db.endpoint_bindings.find_one_and_update(
+            {"ip_address": ip, "port": port,
+             "$or": [{"entity_key": entity_key}, {"registrations": {"$size": 0}}]},
+            {"$set": {"entity_key": entity_key, f"reserved_at.{registration_id}": now},
+             "$addToSet": {"registrations": registration_id}},
+            projection={"_id": 0, "registrations": 1}
+        )
+        if before is not None:
+            return registration_id not in before["registrations"]
+        if await db.endpoint_bindings.count_documents({"ip_address": ip, "port": port}, limit=1):
+            return None
+    return None
+
+def _unregister_update(registration_id: str) -> Dict:
+    return {"$pull": {"registrations": registration_id}, "$unset": {f"reserved_at.{registration_id}": ""}}
+
+async def _remove_empty_bindings():
+    await db.endpoint_bindings.delete_many({"registrations": {"$size": 0}})
+
+async def register_endpoints(registration_id: str, entity_key: str, data: Dict) -> List[Dict]:
+    """Reserve the bindings in ``data`` for a registration, replacing any it held before.
+
+    Returns the conflicts; when there are any, nothing new is reserved.
+    """
+    bindings = _connection_bindings(data)
+    conflicts = _duplicate_bindings(bindings)
+    if conflicts:
+        return conflicts
+    
+    added = []
+    for ip, port in bindings:
+        reserved = await _reserve_binding(ip, port, registration_id, entity_key)
+        if reserved is None:
+            owner = await db.endpoint_bindings.find_one({"ip_address": ip, "port": port}, {"_id": 0})
+            used_by = owner["registrations"][0] if owner and owner["registrations"] else "another connection"
+            conflicts.append({"ip_address": ip, "port": port, "used_by": used_by})
+        elif reserved:
+            added.append((ip, port))
+    
+    if conflicts:
+        for ip, port in added:
+            await db.endpoint_bindings.update_one({"ip_address": ip, "port": port},
+                                                  _unregister_update(registration_id))
+        await _remove_empty_bindings()
+        return conflicts
+    
+    # Release whatever this registration held that it no longer uses
+    await db.endpoint_bindings.update_many(
+        {"registrations": registration_id,
+         "$nor": [{"ip_address": ip, "port": port} for ip, port in bindings]},
+        _unregister_update(registration_id)
+    )
+    await _remove_empty_bindings()
+    return []
+
+async def unregister_endpoints(registration_id: str):
+    await db.endpoint_bindings.update_many({"registrations": registration_id},
+                                           _unregister_update(registration_id))
+    await _remove_empty_bindings()
+
+async def transfer_endpoints(registration_id: str, new_registration_id: str, entity_key: str):
+    """Hand a registration's bindings to another, e.g. an approved create to its connection."""
+    await db.endpoint_bindings.update_many(
+        {"registrations": registration_id},
+        {"$set": {"entity_key": entity_key, "registrations.$": new_registration_id,
+                  f"reserved_at.{new_registration_id}": datetime.now(timezone.utc).isoformat()},
+         "$unset": {f"reserved_at.{registration_id}": ""}}
+    )
+
+async def find_endpoint_conflicts(data: Dict, entity_key: Optional[str] = None) -> List[Dict]:
+    """Bindings in ``data`` already used by another connection or pending change."""
+    bindings = _connection_bindings(data)
+    conflicts = _duplicate_bindings(bindings)
+    async for owner in db.endpoint_bindings.find(
+        {"$or": [{"ip_address": ip, "port": port} for ip, port in dict.fromkeys(bindings)],
+         "registrations.0": {"$exists": True}},
+        {"_id": 0}
+    ):
+        if owner["entity_key"] != entity_key:
+            conflicts.append({"ip_address": owner["ip_address"], "port": owner["port"],
+                              "used_by": owner["registrations"][0]})
+    return conflicts
+
+def _raise_endpoint_conflicts(conflicts: List[Dict]):
+    if conflicts:
+        bindings = ", ".join(f"{c['ip_address']}:{c['port']} ({c['used_by']})" for c in conflicts)
+        raise HTTPException(status_code=400, detail=f"Endpoint already in use: {bindings}")
+
+async def sync_endpoint_bindings():
+    """Register applied connections and outstanding pending changes, dropping stale registrations."""
+    valid = []
+    async for conn in db.connections.find({}, {"_id": 0}):
+        registration_id = f"connection:{conn['id']}"
+        valid.append(registration_id)
+        conflicts = await register_endpoints(registration_id, conn["id"], conn)
+        if conflicts:
+            logging.warning(f"Connection {conn['id']} has conflicting endpoints: {conflicts}")
+    async for change in db.pending_changes.find(
+        {"status": ChangeStatus.PENDING.value, "entity_type": "connection",
+         "change_type": {"$in": ["create", "update"]}},
+        {"_id": 0}
+    ):
+        registration_id = f"pending:{change['id']}"
+        valid.append(registration_id)
+        conflicts = await register_endpoints(registration_id, change.get("entity_id") or registration_id,
+                                             change["new_data"])
+        if conflicts:
+            logging.warning(f"Pending change {change['id']} has conflicting endpoints: {conflicts}")
+    
+    await prune_endpoint_registrations(valid)
+
+async def _registration_exists(registration_id: str) -> bool:
+    kind, _, entity_id = registration_id.partition(":")
+    if kind == "connection":
+        return bool(await db.connections.count_documents({"id": entity_id}, limit=1))
+    if kind == "pending":
+        return bool(await db.pending_changes.count_documents(
+            {"id": entity_id, "status": ChangeStatus.PENDING.value}, limit=1
+        ))
+    return False
+
+def _stale_registrations(binding: Dict, valid: set, cutoff: str) -> List[str]:
+    """Registrations on a binding that are not in ``valid`` and were reserved before ``cutoff``."""
+    reserved_at = binding.get("reserved_at") or {}
+    return [registration_id for registration_id in binding["registrations"]
+            if registration_id not in valid and reserved_at.get(registration_id, "") < cutoff]
+
+async def prune_endpoint_registrations(valid: List[str]) -> List[str]:
+    """Drop registrations whose connection or pending change is gone. Returns the ones dropped.
+
+    Only registrations older than the grace period are considered, and each
+    owner is looked up again first: another worker may have reserved for a
+    pending change it has not inserted yet.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=ENDPOINT_BINDING_GRACE_SECONDS)).isoformat()
+    valid = set(valid)
+    pruned = []
+    async for binding in db.endpoint_bindings.find(
+        {"registrations": {"$elemMatch": {"$nin": list(valid)}}}, {"_id": 0}
+    ):
+        for registration_id in _stale_registrations(binding, valid, cutoff):
+            if await _registration_exists(registration_id):
+                continue
+            result = await db.endpoint_bindings.update_one(
+                {"ip_address": binding["ip_address"], "port": binding["port"],
+                 "$or": [{f"reserved_at.{registration_id}": {"$lt": cutoff}},
+                         {f"reserved_at.{registration_id}": {"$exists": False}}]},
+                _unregister_update(registration_id)
+            )
+            if result.modified_count:
+                pruned.append(registration_id)
+    await _remove_empty_bindings()
+    if pruned:
+        logging.info(f"Pruned stale endpoint registrations: {sorted(set(pruned))}")
+    return pruned
+
+# Per-key alert rate limiter, per worker: key -> {"written_at" (monotonic),
+# "pending" suppressed occurrences, and the latest message/severity/last_seen_at}.
+# A key present here means this worker knows an open alert exists for it.
+_alert_rate_state: Dict[tuple, Dict[str, Any]] = {}
+
+async def _write_alert(key: tuple, count: int, message: str, severity: str, last_seen_at: str):
+    query = {"alert_type": key[0], "entity_type": key[1], "entity_id": key[2], "is_resolved": False}
+    update = {
+        "$inc": {"occurrence_count": count},
+        "$set": {"message": message, "severity": severity, "last_seen_at": last_seen_at},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "created_at": last_seen_at,
+            "first_seen_at": last_seen_at,
+            "resolved_at": None
+        }
+    }
+    try:
+        await db.alerts.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # Another worker inserted the open alert first; fold into it
+        await db.alerts.update_one(query, update)
+    invalidate_cached_reads("alerts", "dashboard")
+
+def _restore_pending_alerts(key: tuple, count: int):
+    """Put back occurrences whose write failed so the next flush retries them."""
+    state = _alert_rate_state.get(key)
+    if state is not None:
+        state["pending"] += count
+
+async def raise_alert(alert_type: AlertType, entity_type: str, entity_id: str,
+                      message: str, severity: str = "medium") -> bool:
+    """Record an alert occurrence, folding repeats into the open alert for the same key.
+
+    Returns True if the occurrence was written to the database, False if it was
+    only counted by the rate limiter; counted occurrences are written by
+    flush_suppressed_alerts().
+    """
+    key = (alert_type.value, entity_type, entity_id)
+    now = datetime.now(timezone.utc).isoformat()
+    state = _alert_rate_state.get(key)
+    if state and time.monotonic() - state["written_at"] < ALERT_MIN_INTERVAL_SECONDS:
+        state.update(pending=state["pending"] + 1, message=message, severity=severity, last_seen_at=now)
+        return False
+
+    # Claim the pending count before writing so concurrent callers don't write it too;
+    # it goes back to the limiter if the write fails
+    pending = state["pending"] if state else 0
+    _alert_rate_state[key] = {"written_at": time.monotonic(), "pending": 0,
+                              "message": message, "severity": severity, "last_seen_at": now}
+    try:
+        await _write_alert(key, 1 + pending, message, severity, now)
+    except Exception:
+        _restore_pending_alerts(key, 1 + pending)
+        raise
+    return True
+
+async def flush_suppressed_alerts():
+    """Write counts held back by the rate limiter once their window has passed."""
+    now_mono = time.monotonic()
+    for key, state in list(_alert_rate_state.items()):
+        if now_mono - state["written_at"] < ALERT_MIN_INTERVAL_SECONDS:
+            continue
+        if not state["pending"]:
+            # Quiet key: forget it so the next occurrence is written straight away
+            del _alert_rate_state[key]
+            continue
+        pending = state["pending"]
+        state.update(written_at=now_mono, pending=0)
+        try:
+            await _write_alert(key, pending, state["message"], state["severity"], state["last_seen_at"])
+        except Exception as e:
+            _restore_pending_alerts(key, pending)
+            logging.error(f"Writing {pending} suppressed occurrences of alert {key} failed: {e}")
+
+async def alert_flush_loop():
+    while True:
+        await asyncio.sleep(ALERT_MIN_INTERVAL_SECONDS)
+        try:
+            await flush_suppressed_alerts()
+        except Exception as e:
+            logging.error(f"Alert flush failed: {e}")
+
+async def migrate_legacy_alerts():
+    """Fold alerts stored one per event (before deduplication) into one open alert per key."""
+    await db.alerts.update_many({"occurrence_count": {"$exists": False}}, {"$set": {"occurrence_count": 1}})
+    await db.alerts.update_many({"first_seen_at": {"$exists": False}}, [{"$set": {"first_seen_at": "$created_at"}}])
+    await db.alerts.update_many({"last_seen_at": {"$exists": False}}, [{"$set": {"last_seen_at": "$created_at"}}])
+    
+    duplicates = db.alerts.aggregate([
+        {"$match": {"is_resolved": False}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {"alert_type": "$alert_type", "entity_type": "$entity_type", "entity_id": "$entity_id"},
+            "ids": {"$push": "$id"},
+            "occurrence_count": {"$sum": "$occurrence_count"},
+            "first_seen_at": {"$min": "$first_seen_at"},
+            "last_seen_at": {"$max": "$last_seen_at"},
+            "message": {"$last": "$message"},
+            "severity": {"$last": "$severity"}
+        }},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ])
+    async for group in duplicates:
+        # Keep the earliest alert, carrying the totals and the latest message
+        keep, merged = group["ids"][0], group["ids"][1:]
+        await db.alerts.update_one({"id": keep}, {"$set": {
+            "occurrence_count": group["occurrence_count"],
+            "first_seen_at": group["first_seen_at"],
+            "last_seen_at": group["last_seen_at"],
+            "message": group["message"],
+            "severity": group["severity"]
+        }})
+        await db.alerts.delete_many({"id": {"$in": merged}})
+        logging.info(f"Merged {len(merged)} duplicate open alerts into {keep}")
+
+def forget_alert_keys(alerts: List[Dict]):
+    """Drop limiter state for resolved alerts so the next occurrence opens a new one."""
+    for alert in alerts:
+        _alert_rate_state.pop((alert["alert_type"], alert["entity_type"], alert["entity_id"]), None)
+
+def _compile_business_config_entry(config: Dict) -> Dict:
+    return {"id": config["id"], "value": config.get("value"), "description": config.get("description")}
+
+def _hash_business_configs(configs: Dict) -> str:
+    canonical = json.dumps(configs, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Compiled business config snapshot shared by all requests in this worker
+_business_config_snapshot: Dict[str, Any] = {"version": -1, "hash": None, "configs": {}, "checked_at": 0.0}
+_business_config_changed = asyncio.Event()
+_business_config_rebuild_lock = asyncio.Lock()
+
+async def _current_business_config_version() -> int:
+    counter = await db.counters.find_one({"_id": "business_config_version"})
+    return counter["value"] if counter else 0
+
+async def get_business_config_snapshot(force: bool = False) -> Dict[str, Any]:
+    """Return the compiled snapshot, rebuilding it if the shared version has moved."""
+    global _business_config_snapshot
+    snapshot = _business_config_snapshot
+    if not force and time.monotonic() - snapshot["checked_at"] < BUSINESS_CONFIG_VERSION_CHECK_SECONDS:
+        return snapshot
+
+    # One rebuild at a time, so a slow rebuild of an older version cannot
+    # replace a newer snapshot
+    async with _business_config_rebuild_lock:
+        snapshot = _business_config_snapshot
+        now_mono = time.monotonic()
+        if not force and now_mono - snapshot["checked_at"] < BUSINESS_CONFIG_VERSION_CHECK_SECONDS:
+            return snapshot
+
+        version = await _current_business_config_version()
+        if version <= snapshot["version"]:
+            snapshot["checked_at"] = now_mono
+            return snapshot
+
+        configs: Dict[str, Dict[str, Any]] = {}
+        async for config in db.business_configs.find({"is_active": True}, {"_id": 0}):
+            configs.setdefault(config["config_type"], {})[config["key"]] = _compile_business_config_entry(config)
+
+        # Deltas are keyed by (since_version, version); drop the ones for older versions
+        invalidate_cached_reads("business_config_changes")
+        _business_config_snapshot = {
+            "version": version,
+            "hash": _hash_business_configs(configs),
+            "configs": configs,
+            "checked_at": now_mono
+        }
+        return _business_config_snapshot
+
+async def publish_business_config_changes(changes: List[Dict]):
+    """Record a new business config version with its changes and wake long-pollers."""
+    global _business_config_changed
+    counter = await db.counters.find_one_and_update(
+        {"_id": "business_config_version"},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await db.business_config_changes.insert_one({
+        "version": counter["value"],
+        "changes": changes,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+    # Clients further behind than the retained log get a full snapshot instead
+    await db.business_config_changes.delete_many(
+        {"version": {"$lte": counter["value"] - BUSINESS_CONFIG_CHANGE_RETENTION}}
+    )
+    await get_business_config_snapshot(force=True)
+
+    event, _business_config_changed = _business_config_changed, asyncio.Event()
+    event.set()
+
+async def apply_switch_node_bundle_change(switch_node_id: str, connection_id: str,
+                                          connection: Optional[Dict] = None):
+    """Upsert (or, with no connection, remove) one connection in its switch node bundle."""
+    if connection is None:
+        update = {"$unset": {f"connections.{connection_id}": ""}, "$inc": {"version": 1}}
+    else:
+        update = {"$set": {f"connections.{connection_id}": connection}, "$inc": {"version": 1}}
+    
+    try:
+        bundle = await db.switch_node_bundles.find_one_and_update(
+            {"switch_node_id": switch_node_id},
+            update,
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await db.switch_node_bundle_changes.insert_one({
+            "switch_node_id": switch_node_id,
+            "version": bundle["version"],
+            "op": "delete" if connection is None else "upsert",
+            "connection_id": connection_id,
+            "connection": connection,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+        await db.switch_node_bundle_changes.delete_many({
+            "switch_node_id": switch_node_id,
+            "version": {"$lte": bundle["version"] - SWITCH_NODE_BUNDLE_CHANGE_RETENTION}
+        })
+    except Exception as e:
+        logging.error(f"Bundle update for switch node {switch_node_id} failed, reconciling: {e}")
+        try:
+            await reconcile_switch_node_bundle(switch_node_id)
+        except Exception as e:
+            logging.error(f"Bundle reconcile for switch node {switch_node_id} failed: {e}")
+
+async def reconcile_switch_node_bundle(switch_node_id: str) -> bool:
+    """Rebuild a switch node bundle from connections if it disagrees. Returns True if rebuilt.
+
+    The version moves without a change record, so clients get a full bundle next.
+    The write only lands if no change was applied since the bundle was read;
+    otherwise the connections are read again.
+    """
+    for _ in range(SWITCH_NODE_BUNDLE_RECONCILE_ATTEMPTS):
+        # Read the bundle before the connections: a change applied in between
+        # moves the version and the conditional write below misses
+        bundle = await db.switch_node_bundles.find_one({"switch_node_id": switch_node_id}, {"_id": 0})
+        connections = {}
+        async for conn in db.connections.find({"switch_node_id": switch_node_id}, {"_id": 0}):
+            connections[conn["id"]] = conn
+        
+        if (bundle or {}).get("connections", {}) == connections:
+            return False
+        
+        if bundle is None:
+            try:
+                await db.switch_node_bundles.insert_one(
+                    {"switch_node_id": switch_node_id, "version": 1, "connections": connections}
+                )
+            except DuplicateKeyError:
+                continue
+        else:
+            result = await db.switch_node_bundles.update_one(
+                {"switch_node_id": switch_node_id, "version": bundle["version"]},
+                {"$set": {"connections": connections}, "$inc": {"version": 1}}
+            )
+            if result.matched_count == 0:
+                continue
+        logging.info(f"Reconciled bundle for switch node {switch_node_id}")
+        return True
+    
+    logging.warning(f"Bundle reconcile for switch node {switch_node_id} kept racing with updates; giving up")
+    return False
+
+async def reconcile_switch_node_bundles() -> List[str]:
+    """Reconcile every switch node that has connections or a bundle."""
+    node_ids = set(await db.connections.distinct("switch_node_id"))
+    node_ids.update(await db.switch_node_bundles.distinct("switch_node_id"))
+    return [node_id for node_id in sorted(node_ids) if await reconcile_switch_node_bundle(node_id)]
+
 def _ensure_git_remote():
     """Ensure the git repository is initialized and the remote is configured."""
     if not (GIT_REPO_PATH / ".git").exists():
@@ -308,8 +908,11 @@ def git_commit_config(connection_id: str, config_data: Dict, message: str):
     try:
         _ensure_git_remote()
         file_path = GIT_REPO_PATH / f"{connection_id}.json"
-        with open(file_path, 'w') as f:
+        # Write then rename so concurrent readers never see a half-written file
+        tmp_path = file_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w') as f:
             json.dump(config_data, f, indent=2, default=str)
+        os.replace(tmp_path, file_path)
         
         subprocess.run(["git", "add", f"{connection_id}.json"], cwd=GIT_REPO_PATH, check=True)
         subprocess.run(["git", "commit", "-m", message], cwd=GIT_REPO_PATH, check=True)
@@ -318,6 +921,282 @@ def git_commit_config(connection_id: str, config_data: Dict, message: str):
         logging.error(f"Git commit failed: {e}")
         return False
 
+def git_delete_config(connection_id: str, message: str):
+    """Remove a configuration file from the Git repository"""
+    file_path = GIT_REPO_PATH / f"{connection_id}.json"
+    if file_path.exists():
+        subprocess.run(["git", "rm", f"{connection_id}.json"], cwd=GIT_REPO_PATH)
+        subprocess.run(["git", "commit", "-m", message], cwd=GIT_REPO_PATH)
+
+def git_read_status() -> str:
+    result = subprocess.run(["git", "status", "--short"], cwd=GIT_REPO_PATH,
+                            capture_output=True, text=True, check=True)
+    return result.stdout
+
+def git_read_log(limit: int) -> List[Dict]:
+    result = subprocess.run(["git", "log", f"-{limit}", "--pretty=format:%H|%an|%ae|%ad|%s"], 
+                          cwd=GIT_REPO_PATH, capture_output=True, text=True, check=True)
+    
+    logs = []
+    for line in result.stdout.split('\n'):
+        if line:
+            parts = line.split('|')
+            logs.append({
+                "commit_hash": parts[0],
+                "author": parts[1],
+                "email": parts[2],
+                "date": parts[3],
+                "message": parts[4]
+            })
+    return logs
+
+def git_read_files(max_bytes: int = GIT_FILES_MAX_BYTES) -> Dict:
+    files_data = []
+    total_bytes = 0
+    
+    # List all JSON files in the git repository, stopping before the response gets too large
+    for file_path in sorted(GIT_REPO_PATH.glob("*.json")):
+        try:
+            total_bytes += file_path.stat().st_size
+            if total_bytes > max_bytes:
+                return {"files": files_data, "truncated": True}
+            with open(file_path, 'r') as f:
+                content = json.load(f)
+                
+            files_data.append({
+                "filename": file_path.name,
+                "connection_id": file_path.stem,
+                "content": content
+            })
+        except Exception as e:
+            logging.error(f"Error reading file {file_path}: {e}")
+    return {"files": files_data, "truncated": False}
+
+def git_read_file(connection_id: str) -> Optional[Dict]:
+    file_path = GIT_REPO_PATH / f"{connection_id}.json"
+    if not file_path.exists():
+        return None
+    
+    with open(file_path, 'r') as f:
+        content = json.load(f)
+    
+    return {
+        "filename": file_path.name,
+        "connection_id": connection_id,
+        "content": content
+    }
+
+def _run_git_job(job: Dict) -> Any:
+    """Execute one queued git job against the working tree. Runs on the lease holder only."""
+    kind = job["kind"]
+    if kind == "commit":
+        if not git_commit_config(job["connection_id"], job["config_data"], job["message"]):
+            raise RuntimeError("Git commit failed")
+        return ""
+    if kind == "delete":
+        git_delete_config(job["connection_id"], job["message"])
+        return ""
+    if kind == "push":
+        _ensure_git_remote()
+        # Push the master branch to the origin remote and set it as the upstream branch
+        result = subprocess.run(["git", "push", "--set-upstream", "origin", "master"],
+                                cwd=GIT_REPO_PATH, capture_output=True, text=True, check=True)
+        return result.stdout
+    if kind == "pull":
+        _ensure_git_remote()
+        result = subprocess.run(["git", "pull", "origin", "master"], cwd=GIT_REPO_PATH,
+                                capture_output=True, text=True, check=True)
+        return result.stdout
+    raise ValueError(f"Unknown git job kind: {kind}")
+
+async def enqueue_git_job(kind: str, connection_id: Optional[str] = None,
+                          config_data: Optional[Dict] = None, message: Optional[str] = None) -> str:
+    job_id = str(uuid.uuid4())
+    await db.git_jobs.insert_one({
+        "id": job_id,
+        "kind": kind,
+        "connection_id": connection_id,
+        "config_data": config_data,
+        "message": message,
+        "status": "queued",
+        "owner": None,
+        "output": None,
+        "error": None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None
+    })
+    return job_id
+
+async def wait_for_git_job(job_id: str, timeout: float = GIT_JOB_WAIT_SECONDS) -> Optional[Dict]:
+    """Poll a git job until it finishes; returns None if it is still pending at timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await db.git_jobs.find_one({"id": job_id}, {"_id": 0, "config_data": 0})
+        if job and job["status"] in ("done", "failed"):
+            return job
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(0.25)
+
+_git_writer_is_leader = False
+
+_git_repo_host: Optional[str] = None
+
+async def get_git_repo_host() -> Optional[str]:
+    """Host whose GIT_REPO_PATH holds the repository; None when it is on a shared volume."""
+    global _git_repo_host
+    if GIT_REPO_SHARED:
+        return None
+    if _git_repo_host is None:
+        if GIT_REPO_HOST:
+            await db.locks.update_one({"_id": "git_repo_host"}, {"$set": {"host": GIT_REPO_HOST}}, upsert=True)
+        else:
+            try:
+                await db.locks.insert_one({"_id": "git_repo_host", "host": HOSTNAME})
+            except DuplicateKeyError:
+                pass
+        pin = await db.locks.find_one({"_id": "git_repo_host"})
+        _git_repo_host = pin["host"]
+    return _git_repo_host
+
+async def git_tree_is_local() -> bool:
+    host = await get_git_repo_host()
+    return host is None or host == HOSTNAME
+
+async def acquire_git_writer_lease() -> bool:
+    """Take or renew the git writer lease. Returns True if this worker holds it."""
+    global _git_writer_is_leader
+    if not await git_tree_is_local():
+        return False
+    now = datetime.now(timezone.utc)
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": "git_writer", "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now.isoformat()}}]},
+            {"$set": {"owner": WORKER_ID,
+                      "read_url": GIT_READ_URL,
+                      "expires_at": (now + timedelta(seconds=GIT_LEASE_TTL_SECONDS)).isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Lease is held by another live worker
+        if _git_writer_is_leader:
+            logging.warning(f"Git writer lease lost by {WORKER_ID}")
+        _git_writer_is_leader = False
+        return False
+    
+    if not _git_writer_is_leader:
+        logging.info(f"Git writer lease acquired by {WORKER_ID}")
+    _git_writer_is_leader = True
+    return True
+
+async def release_git_writer_lease():
+    global _git_writer_is_leader
+    _git_writer_is_leader = False
+    await db.locks.delete_one({"_id": "git_writer", "owner": WORKER_ID})
+
+async def _requeue_stale_git_jobs():
+    """Put back jobs whose runner stopped heartbeating (it died mid-run).
+
+    Called only between runs, so none of these is still executing in this worker.
+    """
+    stale_before = (datetime.now(timezone.utc) - timedelta(seconds=GIT_LEASE_TTL_SECONDS)).isoformat()
+    await db.git_jobs.update_many(
+        {"status": "running", "heartbeat_at": {"$lt": stale_before}},
+        {"$set": {"status": "queued", "owner": None}}
+    )
+
+async def _finish_git_job(job: Dict, run: asyncio.Future):
+    update = {"status": "done", "finished_at": datetime.now(timezone.utc).isoformat()}
+    try:
+        update["output"] = run.result()
+    except subprocess.CalledProcessError as e:
+        update.update(status="failed", error=e.stderr or str(e))
+    except HTTPException as e:
+        update.update(status="failed", error=e.detail)
+    except Exception as e:
+        update.update(status="failed", error=str(e))
+    
+    if update["status"] == "failed":
+        logging.error(f"Git job {job['id']} ({job['kind']}) failed: {update['error']}")
+    
+    query = {"id": job["id"], "owner": WORKER_ID, "status": "running"}
+    try:
+        result = await db.git_jobs.update_one(query, {"$set": update})
+    except Exception as e:
+        # e.g. DocumentTooLarge: record the outcome without the output
+        logging.error(f"Storing the result of git job {job['id']} failed: {e}")
+        result = await db.git_jobs.update_one(query, {"$set": {
+            "status": "failed",
+            "finished_at": update["finished_at"],
+            "error": f"Job ran with status {update['status']} but its result could not be stored: {e}"
+        }})
+    if result.matched_count == 0:
+        logging.warning(f"Git job {job['id']} was taken over before {WORKER_ID} finished it")
+
+async def _run_git_jobs():
+    """Claim and run queued jobs in order until the queue is empty or the lease is lost."""
+    while True:
+        # Any running job, ours or a previous lease holder's, owns the working tree
+        if await db.git_jobs.count_documents({"status": "running"}, limit=1):
+            return
+        
+        job = await db.git_jobs.find_one_and_update(
+            {"status": "queued"},
+            {"$set": {"status": "running", "owner": WORKER_ID,
+                      "heartbeat_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return
+        
+        run = asyncio.ensure_future(asyncio.to_thread(_run_git_job, job))
+        lease_held = True
+        try:
+            while not (await asyncio.wait({run}, timeout=GIT_LEASE_TTL_SECONDS / 3))[0]:
+                # Keep the lease alive through slow pushes and pulls; the job heartbeat
+                # keeps a new lease holder off the working tree until this run ends
+                try:
+                    lease_held = await acquire_git_writer_lease() and lease_held
+                    await db.git_jobs.update_one(
+                        {"id": job["id"], "owner": WORKER_ID},
+                        {"$set": {"heartbeat_at": datetime.now(timezone.utc).isoformat()}}
+                    )
+                except Exception as e:
+                    logging.error(f"Git job {job['id']} heartbeat failed: {e}")
+                    lease_held = False
+        finally:
+            # Never leave while git is still running on the working tree
+            await asyncio.wait({run})
+        
+        await _finish_git_job(job, run)
+        
+        if _git_writer_stopping.is_set() or not lease_held or not await acquire_git_writer_lease():
+            return
+
+_git_writer_stopping = asyncio.Event()
+
+async def git_writer_loop():
+    """Run queued git jobs one at a time while this worker holds the writer lease."""
+    while not _git_writer_stopping.is_set():
+        try:
+            if await acquire_git_writer_lease():
+                await _requeue_stale_git_jobs()
+                await _run_git_jobs()
+                await db.git_jobs.delete_many({
+                    "status": {"$in": ["done", "failed"]},
+                    "finished_at": {"$lt": (datetime.now(timezone.utc)
+                                            - timedelta(hours=GIT_JOB_RETENTION_HOURS)).isoformat()}
+                })
+        except Exception as e:
+            logging.error(f"Git writer loop error: {e}")
+        
+        try:
+            await asyncio.wait_for(_git_writer_stopping.wait(), timeout=GIT_WRITER_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
 # Authentication Routes
 @api_router.post("/auth/register", response_model=UserResponse)
 async def register(user_data: UserCreate):
@@ -370,21 +1249,103 @@ async def create_connection(conn_data: ConnectionCreate, user: Dict = Depends(ge
         maker_username=user["username"]
     )
     
+    # Reserve the bindings first; the unique binding index rejects concurrent duplicates
+    registration_id = f"pending:{pending.id}"
+    _raise_endpoint_conflicts(await register_endpoints(registration_id, registration_id, pending.new_data))
+    
     doc = pending.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.pending_changes.insert_one(doc)
+    try:
+        await db.pending_changes.insert_one(doc)
+    except Exception:
+        await unregister_endpoints(registration_id)
+        raise
+    invalidate_cached_reads("pending_changes", "dashboard")
     
     await log_audit("connection", "pending", "created_pending", user, new_data=conn_data.model_dump())
     
     return {"message": "Connection creation submitted for approval", "pending_change_id": pending.id}
 
-@api_router.get("/connections", response_model=List[Connection])
-async def get_connections(client_type: Optional[ClientType] = None, user: Dict = Depends(get_current_user)):
-    query = {}
+@api_router.post("/connections/validate")
+async def validate_connections(connections: List[ConnectionCreate], user: Dict = Depends(get_current_user)):
+    """Check an import file for endpoint conflicts, against existing bindings and within the file."""
+    entries = [conn_data.model_dump() for conn_data in connections]
+    in_file = _import_file_conflicts(entries)
+    results = []
+    for position, data in enumerate(entries):
+        conflicts = await find_endpoint_conflicts(data)
+        # Repeats within one entry are already reported by find_endpoint_conflicts
+        conflicts += [c for c in in_file.get(position, []) if c["used_by"] != "same submission"]
+        if conflicts:
+            results.append({"index": position, "endpoint_name": data["endpoint_name"], "conflicts": conflicts})
+    
+    return {"valid": not results, "checked": len(connections), "conflicts": results}
+
+CONNECTION_SORT_KEYS = ["endpoint_name", "updated_at"]
+# Indexes for the listings actually issued: the client pages filter by
+# client_type and switch node views by switch_node_id, both ordered by
+# endpoint_name. The other filters are rare and ride on these.
+CONNECTION_INDEXES = [
+    [("endpoint_name", 1)],
+    [("updated_at", 1)],
+    [("client_type", 1), ("endpoint_name", 1)],
+    [("switch_node_id", 1), ("endpoint_name", 1)],
+]
+# Compound indexes earlier releases built for every filter and sort key pair
+LEGACY_CONNECTION_INDEX_FIELDS = ["client_type", "connection_status", "switch_node_id", "client_ip_address",
+                                  "mti_supported"]
+
+@api_router.get("/connections", responses={200: {
+    "model": List[Connection],
+    "description": "Connections; with fields= only the requested keys (plus id) are returned"
+}})
+async def get_connections(client_type: Optional[ClientType] = None,
+                          connection_status: Optional[ConnectionStatus] = None,
+                          switch_node_id: Optional[str] = None,
+                          endpoint_name: Optional[str] = None,
+                          client_ip_address: Optional[str] = None,
+                          mti_supported: Optional[str] = None,
+                          sort: Optional[str] = None,
+                          fields: Optional[str] = None,
+                          user: Dict = Depends(get_current_user)):
+    """List connections.
+
+    ``endpoint_name`` is a prefix search, ``mti_supported`` matches connections
+    supporting that MTI, ``sort`` is a field name with an optional ``-`` for
+    descending order and ``fields`` is a comma-separated projection.
+    """
+    query: Dict[str, Any] = {}
     if client_type:
         query["client_type"] = client_type.value
+    if connection_status:
+        query["connection_status"] = connection_status.value
+    if switch_node_id:
+        query["switch_node_id"] = switch_node_id
+    if endpoint_name:
+        query["endpoint_name"] = {"$regex": f"^{re.escape(endpoint_name)}"}
+    if client_ip_address:
+        query["client_ip_address"] = client_ip_address
+    if mti_supported:
+        query["mti_supported"] = mti_supported
+    
+    projection: Dict[str, int] = {"_id": 0}
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - set(Connection.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        projection.update({f: 1 for f in requested | {"id"}})
+    
+    cursor = db.connections.find(query, projection)
+    if sort:
+        descending = sort.startswith("-")
+        sort_key = sort[1:] if descending else sort
+        if sort_key not in CONNECTION_SORT_KEYS:
+            raise HTTPException(status_code=400,
+                                detail=f"Cannot sort by {sort}; use one of {', '.join(CONNECTION_SORT_KEYS)}")
+        cursor = cursor.sort(sort_key, -1 if descending else 1)
     
-    connections = await db.connections.find(query, {"_id": 0}).to_list(1000)
+    connections = await cursor.to_list(1000)
     
     for conn in connections:
         if isinstance(conn.get('created_at'), str):
@@ -392,7 +1353,9 @@ async def get_connections(client_type: Optional[ClientType] = None, user: Dict =
         if isinstance(conn.get('updated_at'), str):
             conn['updated_at'] = datetime.fromisoformat(conn['updated_at'])
     
-    return connections
+    if fields:
+        return connections
+    return [Connection(**conn) for conn in connections]
 
 @api_router.get("/connections/{connection_id}", response_model=Connection)
 async def get_connection(connection_id: str, user: Dict = Depends(get_current_user)):
@@ -424,9 +1387,17 @@ async def update_connection(connection_id: str, conn_data: ConnectionCreate, use
         maker_username=user["username"]
     )
     
+    registration_id = f"pending:{pending.id}"
+    _raise_endpoint_conflicts(await register_endpoints(registration_id, connection_id, pending.new_data))
+    
     doc = pending.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.pending_changes.insert_one(doc)
+    try:
+        await db.pending_changes.insert_one(doc)
+    except Exception:
+        await unregister_endpoints(registration_id)
+        raise
+    invalidate_cached_reads("pending_changes", "dashboard")
     
     return {"message": "Connection update submitted for approval", "pending_change_id": pending.id}
 
@@ -450,21 +1421,25 @@ async def delete_connection(connection_id: str, user: Dict = Depends(get_current
     doc = pending.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.pending_changes.insert_one(doc)
+    invalidate_cached_reads("pending_changes", "dashboard")
     
     return {"message": "Connection deletion submitted for approval", "pending_change_id": pending.id}
 
 # Pending Changes Routes (Maker-Checker)
 @api_router.get("/pending-changes", response_model=List[PendingChange])
 async def get_pending_changes(user: Dict = Depends(get_current_user)):
-    changes = await db.pending_changes.find({"status": ChangeStatus.PENDING.value}, {"_id": 0}).to_list(1000)
-    
-    for change in changes:
-        if isinstance(change.get('created_at'), str):
-            change['created_at'] = datetime.fromisoformat(change['created_at'])
-        if change.get('reviewed_at') and isinstance(change['reviewed_at'], str):
-            change['reviewed_at'] = datetime.fromisoformat(change['reviewed_at'])
+    async def compute():
+        changes = await db.pending_changes.find({"status": ChangeStatus.PENDING.value}, {"_id": 0}).to_list(1000)
+        
+        for change in changes:
+            if isinstance(change.get('created_at'), str):
+                change['created_at'] = datetime.fromisoformat(change['created_at'])
+            if change.get('reviewed_at') and isinstance(change['reviewed_at'], str):
+                change['reviewed_at'] = datetime.fromisoformat(change['reviewed_at'])
+        
+        return changes
     
-    return changes
+    return await cached_read("pending_changes", ("/pending-changes", user["role"]), compute)
 
 @api_router.post("/pending-changes/{change_id}/review")
 async def review_pending_change(change_id: str, review: PendingChangeReview, user: Dict = Depends(get_current_user)):
@@ -485,6 +1460,7 @@ async def review_pending_change(change_id: str, review: PendingChangeReview, use
     }
     
     await db.pending_changes.update_one({"id": change_id}, {"$set": update_data})
+    invalidate_cached_reads("pending_changes", "dashboard")
     
     # If approved, apply the change
     if review.status == ChangeStatus.APPROVED:
@@ -496,39 +1472,109 @@ async def review_pending_change(change_id: str, review: PendingChangeReview, use
                 doc['created_at'] = doc['created_at'].isoformat()
                 doc['updated_at'] = doc['updated_at'].isoformat()
                 await db.connections.insert_one(doc)
+                await transfer_endpoints(f"pending:{change_id}", f"connection:{conn.id}", conn.id)
+                await apply_switch_node_bundle_change(conn.switch_node_id, conn.id,
+                                                      {k: v for k, v in doc.items() if k != "_id"})
                 
                 # Commit to Git
-                git_commit_config(conn.id, doc, f"Create connection {conn.client_node_id}")
+                await enqueue_git_job("commit", conn.id, doc, f"Create connection {conn.client_node_id}")
                 
                 await log_audit("connection", conn.id, "created", user, new_data=doc)
                 
             elif change["change_type"] == "update":
                 conn_data = change["new_data"]
                 conn_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-                await db.connections.update_one({"id": change["entity_id"]}, {"$set": conn_data})
+                previous = await db.connections.find_one_and_update(
+                    {"id": change["entity_id"]}, {"$set": conn_data}, projection={"_id": 0}
+                )
+                
+                if previous:
+                    updated = {**previous, **conn_data}
+                    if previous["switch_node_id"] != updated["switch_node_id"]:
+                        await apply_switch_node_bundle_change(previous["switch_node_id"], change["entity_id"])
+                    await apply_switch_node_bundle_change(updated["switch_node_id"], change["entity_id"], updated)
+                    conflicts = await register_endpoints(f"connection:{change['entity_id']}",
+                                                         change["entity_id"], updated)
+                    if conflicts:
+                        logging.warning(f"Approved update of {change['entity_id']} conflicts: {conflicts}")
                 
                 # Commit to Git
-                git_commit_config(change["entity_id"], conn_data, f"Update connection {change['entity_id']}")
+                await enqueue_git_job("commit", change["entity_id"], conn_data,
+                                      f"Update connection {change['entity_id']}")
                 
                 await log_audit("connection", change["entity_id"], "updated", user, 
                               old_data=change["old_data"], new_data=conn_data)
                 
             elif change["change_type"] == "delete":
-                await db.connections.delete_one({"id": change["entity_id"]})
+                deleted = await db.connections.find_one_and_delete({"id": change["entity_id"]}, projection={"_id": 0})
+                if deleted:
+                    await apply_switch_node_bundle_change(deleted["switch_node_id"], change["entity_id"])
+                await unregister_endpoints(f"connection:{change['entity_id']}")
                 
                 # Commit to Git
-                file_path = GIT_REPO_PATH / f"{change['entity_id']}.json"
-                if file_path.exists():
-                    subprocess.run(["git", "rm", f"{change['entity_id']}.json"], cwd=GIT_REPO_PATH)
-                    subprocess.run(["git", "commit", "-m", f"Delete connection {change['entity_id']}"], cwd=GIT_REPO_PATH)
+                await enqueue_git_job("delete", change["entity_id"], message=f"Delete connection {change['entity_id']}")
                 
                 await log_audit("connection", change["entity_id"], "deleted", user, old_data=change["old_data"])
+            
+            invalidate_cached_reads("dashboard")
+    
+    # The pending change no longer holds its bindings, whatever the outcome
+    await unregister_endpoints(f"pending:{change_id}")
     
     action = "approved" if review.status == ChangeStatus.APPROVED else "rejected"
     await log_audit("pending_change", change_id, action, user)
     
     return {"message": f"Change {review.status.value} successfully"}
 
+# Switch Node Bundle Routes
+@api_router.get("/switch-nodes/{switch_node_id}/bundle")
+async def get_switch_node_bundle(switch_node_id: str, since_version: Optional[int] = None,
+                                 user: Dict = Depends(get_current_user)):
+    """Connections for one switch node: 304 if unchanged, else a delta or the full bundle."""
+    bundle = await db.switch_node_bundles.find_one({"switch_node_id": switch_node_id}, {"_id": 0})
+    if not bundle:
+        bundle = {"switch_node_id": switch_node_id, "version": 0, "connections": {}}
+    
+    version = bundle["version"]
+    if since_version is not None and since_version == version:
+        return Response(status_code=304)
+    
+    if since_version is not None and 0 <= since_version < version:
+        changes = await db.switch_node_bundle_changes.find(
+            {"switch_node_id": switch_node_id, "version": {"$gt": since_version, "$lte": version}},
+            {"_id": 0, "switch_node_id": 0}
+        ).sort("version", 1).to_list(None)
+        if len(changes) == version - since_version:
+            return {
+                "type": "delta",
+                "switch_node_id": switch_node_id,
+                "since_version": since_version,
+                "version": version,
+                "changes": changes
+            }
+    
+    return {
+        "type": "full",
+        "switch_node_id": switch_node_id,
+        "version": version,
+        "connections": list(bundle.get("connections", {}).values())
+    }
+
+@api_router.post("/switch-nodes/{switch_node_id}/bundle/reconcile")
+async def reconcile_switch_node_bundle_route(switch_node_id: str,
+                                             user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    rebuilt = await reconcile_switch_node_bundle(switch_node_id)
+    if rebuilt:
+        await log_audit("switch_node_bundle", switch_node_id, "reconciled", user)
+    return {"switch_node_id": switch_node_id, "rebuilt": rebuilt}
+
+@api_router.post("/switch-nodes/bundles/reconcile")
+async def reconcile_switch_node_bundles_route(user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    rebuilt = await reconcile_switch_node_bundles()
+    if rebuilt:
+        await log_audit("switch_node_bundle", "all", "reconciled", user, new_data={"rebuilt": rebuilt})
+    return {"rebuilt": rebuilt}
+
 def convert_object_ids(data):
     """Recursively convert ObjectId instances to strings."""
     if isinstance(data, dict):
@@ -578,26 +1624,68 @@ async def get_alerts(is_resolved: Optional[bool] = None, user: Dict = Depends(ge
     if is_resolved is not None:
         query["is_resolved"] = is_resolved
     
-    alerts = await db.alerts.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    async def compute():
+        alerts = await db.alerts.find(query, {"_id": 0}).sort("last_seen_at", -1).to_list(1000)
+        
+        for alert in alerts:
+            for field in ('created_at', 'first_seen_at', 'last_seen_at', 'resolved_at'):
+                if alert.get(field) and isinstance(alert[field], str):
+                    alert[field] = datetime.fromisoformat(alert[field])
+        
+        return alerts
     
-    for alert in alerts:
-        if isinstance(alert.get('created_at'), str):
-            alert['created_at'] = datetime.fromisoformat(alert['created_at'])
-        if alert.get('resolved_at') and isinstance(alert['resolved_at'], str):
-            alert['resolved_at'] = datetime.fromisoformat(alert['resolved_at'])
+    return await cached_read("alerts", ("/alerts", is_resolved, user["role"]), compute)
+
+@api_router.post("/alerts")
+async def create_alert(alert_data: AlertCreate, user: Dict = Depends(get_current_user)):
+    recorded = await raise_alert(alert_data.alert_type, alert_data.entity_type, alert_data.entity_id,
+                                 alert_data.message, alert_data.severity)
+    return {"message": "Alert recorded" if recorded else "Alert suppressed", "recorded": recorded}
+
+@api_router.post("/alerts/resolve")
+async def resolve_alerts(alert_filter: AlertResolveFilter, user: Dict = Depends(get_current_user)):
+    query: Dict[str, Any] = {"is_resolved": False}
+    if alert_filter.alert_ids:
+        query["id"] = {"$in": alert_filter.alert_ids}
+    if alert_filter.alert_type:
+        query["alert_type"] = alert_filter.alert_type.value
+    if alert_filter.entity_type:
+        query["entity_type"] = alert_filter.entity_type
+    if alert_filter.entity_id:
+        query["entity_id"] = alert_filter.entity_id
+    
+    if len(query) == 1:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    
+    resolved = await db.alerts.find(
+        query, {"_id": 0, "alert_type": 1, "entity_type": 1, "entity_id": 1}
+    ).to_list(None)
+    result = await db.alerts.update_many(
+        query,
+        {"$set": {"is_resolved": True, "resolved_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    forget_alert_keys(resolved)
+    invalidate_cached_reads("alerts", "dashboard")
     
-    return alerts
+    await log_audit("alert", "bulk", "resolved", user, new_data={"filter": alert_filter.model_dump(mode="json"),
+                                                                 "resolved_count": result.modified_count})
+    
+    return {"message": "Alerts resolved", "resolved_count": result.modified_count}
 
 @api_router.post("/alerts/{alert_id}/resolve")
 async def resolve_alert(alert_id: str, user: Dict = Depends(get_current_user)):
-    result = await db.alerts.update_one(
+    alert = await db.alerts.find_one_and_update(
         {"id": alert_id},
-        {"$set": {"is_resolved": True, "resolved_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"is_resolved": True, "resolved_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0, "alert_type": 1, "entity_type": 1, "entity_id": 1}
     )
     
-    if result.matched_count == 0:
+    if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
+    forget_alert_keys([alert])
+    invalidate_cached_reads("alerts", "dashboard")
+    
     return {"message": "Alert resolved"}
 
 # Threshold Routes
@@ -651,6 +1739,74 @@ async def get_business_configs(config_type: Optional[str] = None, user: Dict = D
     
     return configs
 
+@api_router.get("/business-configs/snapshot")
+async def get_business_config_snapshot_route(since_version: Optional[int] = None, wait: int = 0,
+                                             user: Dict = Depends(get_current_user)):
+    """Compiled business configs: 304 if unchanged, else a delta or a full snapshot.
+
+    With ``wait`` > 0 and an up-to-date ``since_version`` the request is held
+    until the next version is published or the wait expires.
+    """
+    snapshot = await get_business_config_snapshot()
+    if since_version is not None and since_version > snapshot["version"]:
+        # The client saw a version published through another worker
+        snapshot = await get_business_config_snapshot(force=True)
+    
+    if since_version is not None and since_version == snapshot["version"] and wait > 0:
+        deadline = time.monotonic() + min(wait, BUSINESS_CONFIG_MAX_WAIT_SECONDS)
+        while snapshot["version"] == since_version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(_business_config_changed.wait(),
+                                       timeout=min(remaining, BUSINESS_CONFIG_VERSION_CHECK_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+            snapshot = await get_business_config_snapshot()
+    
+    delta = None
+    if since_version is not None and 0 <= since_version < snapshot["version"]:
+        delta = await get_business_config_delta(since_version, snapshot["version"])
+    return _business_config_response(snapshot, since_version, delta)
+
+async def get_business_config_delta(since_version: int, version: int) -> Optional[List[Dict]]:
+    """Changes from ``since_version`` to ``version``, or None if some are no longer retained.
+
+    Published versions never change, so every client at the same version
+    shares one lookup.
+    """
+    async def compute():
+        entries = await db.business_config_changes.find(
+            {"version": {"$gt": since_version, "$lte": version}}, {"_id": 0}
+        ).sort("version", 1).to_list(None)
+        if len(entries) != version - since_version:
+            return None
+        return [change for entry in entries for change in entry["changes"]]
+    
+    return await cached_read("business_config_changes", (since_version, version), compute)
+
+def _business_config_response(snapshot: Dict[str, Any], since_version: Optional[int],
+                              delta: Optional[List[Dict]] = None):
+    if since_version is not None and since_version >= snapshot["version"]:
+        return Response(status_code=304)
+    
+    if delta is not None:
+        return {
+            "type": "delta",
+            "since_version": since_version,
+            "version": snapshot["version"],
+            "hash": snapshot["hash"],
+            "changes": delta
+        }
+    
+    return {
+        "type": "full",
+        "version": snapshot["version"],
+        "hash": snapshot["hash"],
+        "configs": snapshot["configs"]
+    }
+
 @api_router.post("/business-configs", response_model=BusinessConfig)
 async def create_business_config(config_data: BusinessConfigCreate, user: Dict = Depends(get_current_user)):
     config = BusinessConfig(**config_data.model_dump())
@@ -660,6 +1816,11 @@ async def create_business_config(config_data: BusinessConfigCreate, user: Dict =
     doc['updated_at'] = doc['updated_at'].isoformat()
     await db.business_configs.insert_one(doc)
     
+    await publish_business_config_changes([
+        {"op": "upsert", "config_type": config.config_type, "key": config.key,
+         "entry": _compile_business_config_entry(doc)}
+    ])
+    
     await log_audit("business_config", config.id, "created", user, new_data=doc)
     
     return config
@@ -679,6 +1840,15 @@ async def update_business_config(config_id: str, config_data: BusinessConfigCrea
     await log_audit("business_config", config_id, "updated", user, old_data=existing, new_data=update_data)
     
     updated = await db.business_configs.find_one({"id": config_id}, {"_id": 0})
+    
+    if existing.get("is_active", True):
+        changes = []
+        if (existing["config_type"], existing["key"]) != (updated["config_type"], updated["key"]):
+            changes.append({"op": "delete", "config_type": existing["config_type"], "key": existing["key"]})
+        changes.append({"op": "upsert", "config_type": updated["config_type"], "key": updated["key"],
+                        "entry": _compile_business_config_entry(updated)})
+        await publish_business_config_changes(changes)
+    
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     if isinstance(updated.get('updated_at'), str):
@@ -688,141 +1858,420 @@ async def update_business_config(config_id: str, config_data: BusinessConfigCrea
 
 @api_router.delete("/business-configs/{config_id}")
 async def delete_business_config(config_id: str, user: Dict = Depends(get_current_user)):
-    result = await db.business_configs.update_one({"id": config_id}, {"$set": {"is_active": False}})
+    existing = await db.business_configs.find_one_and_update(
+        {"id": config_id}, {"$set": {"is_active": False}}, projection={"_id": 0}
+    )
     
-    if result.matched_count == 0:
+    if not existing:
         raise HTTPException(status_code=404, detail="Config not found")
     
+    if existing.get("is_active", True):
+        await publish_business_config_changes([
+            {"op": "delete", "config_type": existing["config_type"], "key": existing["key"]}
+        ])
+    
     await log_audit("business_config", config_id, "deleted", user)
     
     return {"message": "Config deleted"}
 
 # Git Operations
-@api_router.get("/git/status")
-async def git_status(user: Dict = Depends(require_role([UserRole.ADMIN]))):
+def _forward_git_read(url: str, authorization: Optional[str]) -> Any:
+    request = urllib.request.Request(url, headers={
+        "Authorization": authorization or "",
+        GIT_READ_PROXY_HEADER: WORKER_ID
+    })
     try:
-        result = subprocess.run(["git", "status", "--short"], cwd=GIT_REPO_PATH, 
-                              capture_output=True, text=True, check=True)
-        return {"status": result.stdout}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git status failed: {e.stderr}")
+        with urllib.request.urlopen(request, timeout=GIT_READ_TIMEOUT_SECONDS) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            detail = json.load(e).get("detail", e.reason)
+        except ValueError:
+            detail = e.reason
+        raise HTTPException(status_code=e.code, detail=detail)
+    except (urllib.error.URLError, OSError) as e:
+        raise HTTPException(status_code=503, detail=f"Git repository host is unreachable: {e}")
+
+async def read_git_tree(request: Request, read) -> Any:
+    """Run a read-only git endpoint against the working tree.
+
+    Reads bypass the job queue. Workers on the repository host call `read` in a
+    thread; others forward the request to the lease holder's GIT_READ_URL.
+    """
+    if await git_tree_is_local():
+        return await asyncio.to_thread(read)
+    if request.headers.get(GIT_READ_PROXY_HEADER):
+        # Forwarded here by a worker that thought this host holds the repository
+        raise HTTPException(status_code=503, detail="Git repository is not on this host")
+    lease = await db.locks.find_one({"_id": "git_writer"})
+    if not lease or not lease.get("read_url"):
+        raise HTTPException(status_code=503, detail="Git repository host is not reachable for reads")
+    url = lease["read_url"].rstrip("/") + request.url.path
+    if request.url.query:
+        url += f"?{request.url.query}"
+    return await asyncio.to_thread(_forward_git_read, url, request.headers.get("Authorization"))
+
+@api_router.get("/git/status")
+async def git_status(request: Request, user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    def read():
+        try:
+            return {"status": git_read_status()}
+        except subprocess.CalledProcessError as e:
+            raise HTTPException(status_code=500, detail=f"Git status failed: {e.stderr}")
+    return await read_git_tree(request, read)
+
+async def _run_git_remote_job(kind: str, label: str) -> Dict:
+    job_id = await enqueue_git_job(kind)
+    job = await wait_for_git_job(job_id)
+    if job is None:
+        return {"message": f"Git {label} queued", "job_id": job_id}
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Git {label} failed: {job['error']}")
+    return {"job_id": job_id, "output": job["output"]}
 
 @api_router.post("/git/push")
 async def git_push(user: Dict = Depends(require_role([UserRole.ADMIN]))):
-    try:
-        _ensure_git_remote()
-        # Push the master branch to the origin remote and set it as the upstream branch
-        result = subprocess.run(
-            ["git", "push", "--set-upstream", "origin", "master"],
-            cwd=GIT_REPO_PATH,
-            capture_output=True,
-            text=True,
-            check=True
-        )
+    result = await _run_git_remote_job("push", "push")
+    if "output" in result:
         await log_audit("git", "repository", "pushed", user)
-        return {"message": "Pushed to remote", "output": result.stdout}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git push failed: {e.stderr}")
+        result["message"] = "Pushed to remote"
+    return result
 
 @api_router.post("/git/pull")
 async def git_pull(user: Dict = Depends(require_role([UserRole.ADMIN]))):
-    try:
-        _ensure_git_remote()
-        result = subprocess.run(["git", "pull", "origin", "master"], cwd=GIT_REPO_PATH,
-                              capture_output=True, text=True, check=True)
+    result = await _run_git_remote_job("pull", "pull")
+    if "output" in result:
         await log_audit("git", "repository", "pulled", user)
-        return {"message": "Pulled from remote", "output": result.stdout}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git pull failed: {e.stderr}")
+        result["message"] = "Pulled from remote"
+    return result
+
+@api_router.get("/git/jobs/{job_id}")
+async def get_git_job(job_id: str, user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    job = await db.git_jobs.find_one({"id": job_id}, {"_id": 0, "config_data": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Git job not found")
+    return job
 
 @api_router.get("/git/log")
-async def git_log(limit: int = 20, user: Dict = Depends(get_current_user)):
-    try:
-        result = subprocess.run(["git", "log", f"-{limit}", "--pretty=format:%H|%an|%ae|%ad|%s"], 
-                              cwd=GIT_REPO_PATH, capture_output=True, text=True, check=True)
-        
-        logs = []
-        for line in result.stdout.split('\n'):
-            if line:
-                parts = line.split('|')
-                logs.append({
-                    "commit_hash": parts[0],
-                    "author": parts[1],
-                    "email": parts[2],
-                    "date": parts[3],
-                    "message": parts[4]
-                })
-        
-        return {"logs": logs}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Git log failed: {e.stderr}")
+async def git_log(request: Request, limit: int = 20, user: Dict = Depends(get_current_user)):
+    def read():
+        try:
+            return {"logs": git_read_log(limit)}
+        except subprocess.CalledProcessError as e:
+            raise HTTPException(status_code=500, detail=f"Git log failed: {e.stderr}")
+    return await read_git_tree(request, read)
 
 @api_router.get("/git/files")
-async def get_git_files(user: Dict = Depends(get_current_user)):
-    try:
-        files_data = []
-        
-        # List all JSON files in the git repository
-        for file_path in GIT_REPO_PATH.glob("*.json"):
-            try:
-                with open(file_path, 'r') as f:
-                    content = json.load(f)
-                    
-                files_data.append({
-                    "filename": file_path.name,
-                    "connection_id": file_path.stem,
-                    "content": content
-                })
-            except Exception as e:
-                logging.error(f"Error reading file {file_path}: {e}")
-        
-        return {"files": files_data}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read Git files: {str(e)}")
+async def get_git_files(request: Request, user: Dict = Depends(get_current_user)):
+    def read():
+        try:
+            return git_read_files()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read Git files: {str(e)}")
+    return await read_git_tree(request, read)
 
 @api_router.get("/git/file/{connection_id}")
-async def get_git_file(connection_id: str, user: Dict = Depends(get_current_user)):
-    try:
-        file_path = GIT_REPO_PATH / f"{connection_id}.json"
-        
-        if not file_path.exists():
+async def get_git_file(request: Request, connection_id: str, user: Dict = Depends(get_current_user)):
+    def read():
+        try:
+            file_data = git_read_file(connection_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to read file: {str(e)}")
+        if file_data is None:
             raise HTTPException(status_code=404, detail="Configuration file not found")
-        
-        with open(file_path, 'r') as f:
-            content = json.load(f)
-        
-        return {
-            "filename": file_path.name,
-            "connection_id": connection_id,
-            "content": content
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read file: {str(e)}")
+        return file_data
+    return await read_git_tree(request, read)
 
 # Dashboard Stats
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(user: Dict = Depends(get_current_user)):
-    total_connections = await db.connections.count_documents({})
-    active_connections = await db.connections.count_documents({"connection_status": ConnectionStatus.ACTIVE.value})
-    pending_changes = await db.pending_changes.count_documents({"status": ChangeStatus.PENDING.value})
-    unresolved_alerts = await db.alerts.count_documents({"is_resolved": False})
-    acquiring_count = await db.connections.count_documents({"client_type": ClientType.ACQUIRING.value})
-    issuing_count = await db.connections.count_documents({"client_type": ClientType.ISSUING.value})
+    async def compute():
+        total_connections = await db.connections.count_documents({})
+        active_connections = await db.connections.count_documents({"connection_status": ConnectionStatus.ACTIVE.value})
+        pending_changes = await db.pending_changes.count_documents({"status": ChangeStatus.PENDING.value})
+        unresolved_alerts = await db.alerts.count_documents({"is_resolved": False})
+        acquiring_count = await db.connections.count_documents({"client_type": ClientType.ACQUIRING.value})
+        issuing_count = await db.connections.count_documents({"client_type": ClientType.ISSUING.value})
+        
+        return {
+            "total_connections": total_connections,
+            "active_connections": active_connections,
+            "pending_changes": pending_changes,
+            "unresolved_alerts": unresolved_alerts,
+            "acquiring_count": acquiring_count,
+            "issuing_count": issuing_count
+        }
     
+    return await cached_read("dashboard", ("/dashboard/stats", user["role"]), compute)
+
+# Request Profiling
+# Armed by an admin for the next N requests whose path matches a pattern. The
+# session lives in Mongo (profiling_sessions) so every worker sees it; each
+# worker polls it into a local flag, so requests pay one flag check while
+# profiling is off. While disarmed the poll backs off to
+# PROFILING_IDLE_POLL_SECONDS, so a session armed through another worker can
+# take that long to reach this one. A sampler thread records wall-clock stacks of each profiled
+# request's task: the loop thread's stack while the task is running (blocking
+# git subprocess calls, bcrypt) and the coroutine await chain while it is
+# suspended (Motor). Finished profiles are stored in request_profiles.
+PROFILING_POLL_SECONDS = 1.0
+PROFILING_IDLE_POLL_SECONDS = 30.0
+PROFILE_RETENTION = 20
+
+_profiling_armed = False
+_profiling_state: Dict[str, Any] = {"pattern": None, "interval": 0.005}
+_profiling_lock = threading.Lock()
+_active_profiles: Dict[str, Dict[str, Any]] = {}
+_profiler_thread: Optional[threading.Thread] = None
+_profiling_watch_wake = asyncio.Event()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+def _sample_task_stack(task: asyncio.Task, thread_id: int) -> Optional[tuple]:
+    coro = task.get_coro()
+    root = getattr(coro, "cr_frame", None)
+    if root is None:
+        return None
+    
+    # Running: the task's frames are on the loop thread's stack
+    frames = []
+    frame = sys._current_frames().get(thread_id)
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            return tuple(_frame_label(f) for f in reversed(frames))
+        frame = frame.f_back
+    
+    # Suspended: follow the await chain down to what it is waiting on
+    labels = []
+    awaited = coro
+    while awaited is not None:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None)
+        if frame is None:
+            labels.append(f"<await {type(awaited).__name__}>")
+            break
+        labels.append(_frame_label(frame))
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None)
+    return tuple(labels)
+
+def _profiler_loop():
+    global _profiler_thread
+    while True:
+        with _profiling_lock:
+            if not _active_profiles:
+                _profiler_thread = None
+                return
+            for profile in _active_profiles.values():
+                stack = _sample_task_stack(profile["task"], profile["thread_id"])
+                if stack:
+                    profile["stacks"][stack] += 1
+            interval = _profiling_state["interval"]
+        time.sleep(interval)
+
+def _ensure_profiler_thread():
+    global _profiler_thread
+    with _profiling_lock:
+        if _profiler_thread is None:
+            _profiler_thread = threading.Thread(target=_profiler_loop, name="request-profiler", daemon=True)
+            _profiler_thread.start()
+
+def _apply_profiling_session(session: Optional[Dict]):
+    """Mirror the shared profiling session into this worker's flag and pattern."""
+    global _profiling_armed
+    if session and session.get("armed") and session.get("remaining", 0) > 0:
+        pattern = _profiling_state["pattern"]
+        if pattern is None or pattern.pattern != session["route_pattern"]:
+            _profiling_state["pattern"] = re.compile(session["route_pattern"])
+        _profiling_state["interval"] = session["interval_ms"] / 1000
+        _profiling_armed = True
+    else:
+        _profiling_armed = False
+
+def _next_profiling_poll_delay(delay: float) -> float:
+    """Poll every second while armed; double the wait while disarmed, up to the idle cap."""
+    if _profiling_armed:
+        return PROFILING_POLL_SECONDS
+    return min(delay * 2, PROFILING_IDLE_POLL_SECONDS)
+
+async def profiling_watch_loop():
+    delay = PROFILING_POLL_SECONDS
+    while True:
+        try:
+            _apply_profiling_session(await db.profiling_sessions.find_one({"_id": "current"}))
+        except Exception as e:
+            logging.error(f"Profiling session poll failed: {e}")
+        delay = _next_profiling_poll_delay(delay)
+        # Arming through this worker wakes the loop straight away
+        try:
+            await asyncio.wait_for(_profiling_watch_wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        _profiling_watch_wake.clear()
+
+async def _claim_profiling_slot() -> bool:
+    """Take one of the remaining profiled requests, shared across workers."""
+    session = await db.profiling_sessions.find_one_and_update(
+        {"_id": "current", "armed": True, "remaining": {"$gt": 0}},
+        {"$inc": {"remaining": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if session and session["remaining"] <= 0:
+        await db.profiling_sessions.update_one({"_id": "current", "remaining": {"$lte": 0}},
+                                               {"$set": {"armed": False}})
+    _apply_profiling_session(session)
+    return session is not None
+
+async def _store_profile(profile: Dict):
+    await db.request_profiles.insert_one(profile)
+    stale = await db.request_profiles.find({}, {"_id": 0, "started_at": 1}).sort(
+        "started_at", -1).skip(PROFILE_RETENTION).limit(1).to_list(1)
+    if stale:
+        await db.request_profiles.delete_many({"started_at": {"$lte": stale[0]["started_at"]}})
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles matching requests while profiling is armed."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if (not _profiling_armed or scope["type"] != "http"
+                or not _profiling_state["pattern"].search(scope["path"])):
+            return await self.app(scope, receive, send)
+        try:
+            claimed = await _claim_profiling_slot()
+        except Exception as e:
+            # Profiling must never fail the request itself
+            logging.error(f"Claiming a profiling slot failed, serving unprofiled: {e}")
+            claimed = False
+        if not claimed:
+            return await self.app(scope, receive, send)
+        
+        profile_id = str(uuid.uuid4())
+        profile = {
+            "task": asyncio.current_task(),
+            "thread_id": threading.get_ident(),
+            "stacks": Counter()
+        }
+        with _profiling_lock:
+            _active_profiles[profile_id] = profile
+        _ensure_profiler_thread()
+        
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            with _profiling_lock:
+                _active_profiles.pop(profile_id, None)
+            try:
+                await _store_profile({
+                    "id": profile_id,
+                    "worker_id": WORKER_ID,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "started_at": started_at.isoformat(),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "interval_ms": _profiling_state["interval"] * 1000,
+                    "samples": sum(profile["stacks"].values()),
+                    "stacks": [{"frames": list(stack), "count": count}
+                               for stack, count in profile["stacks"].items()]
+                })
+            except Exception as e:
+                logging.error(f"Storing profile {profile_id} failed: {e}")
+
+def _profile_to_collapsed(profile: Dict) -> str:
+    return "\n".join(f"{';'.join(entry['frames'])} {entry['count']}" for entry in profile["stacks"])
+
+def _profile_to_speedscope(profile: Dict) -> Dict:
+    frame_index: Dict[str, int] = {}
+    samples, weights = [], []
+    for entry in profile["stacks"]:
+        samples.append([frame_index.setdefault(label, len(frame_index)) for label in entry["frames"]])
+        weights.append(entry["count"] * profile["interval_ms"])
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": label} for label in frame_index]},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{profile['method']} {profile['path']}",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights
+        }],
+        "name": f"{profile['method']} {profile['path']} ({profile['started_at']})",
+        "exporter": "toolbox-network-scheme-manager"
+    }
+
+async def _profiling_status() -> Dict:
+    session = await db.profiling_sessions.find_one({"_id": "current"}, {"_id": 0}) or {}
+    armed = bool(session.get("armed")) and session.get("remaining", 0) > 0
+    profiles = await db.request_profiles.find({}, {"_id": 0, "stacks": 0}).sort("started_at", -1).to_list(None)
     return {
-        "total_connections": total_connections,
-        "active_connections": active_connections,
-        "pending_changes": pending_changes,
-        "unresolved_alerts": unresolved_alerts,
-        "acquiring_count": acquiring_count,
-        "issuing_count": issuing_count
+        "armed": armed,
+        "route_pattern": session.get("route_pattern"),
+        "remaining": session.get("remaining", 0) if armed else 0,
+        "profiles": profiles
+    }
+
+@api_router.post("/admin/profiling")
+async def start_profiling(profiling: ProfilingRequest, user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    try:
+        re.compile(profiling.route_pattern)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid route pattern: {e}")
+    
+    session = {
+        "armed": True,
+        "route_pattern": profiling.route_pattern,
+        "remaining": profiling.requests,
+        "interval_ms": profiling.interval_ms,
+        "armed_at": datetime.now(timezone.utc).isoformat(),
+        "armed_by": user["id"]
     }
+    await db.profiling_sessions.update_one({"_id": "current"}, {"$set": session}, upsert=True)
+    _apply_profiling_session(session)
+    _profiling_watch_wake.set()
+    
+    await log_audit("profiling", "requests", "armed", user, new_data=profiling.model_dump())
+    
+    return await _profiling_status()
+
+@api_router.delete("/admin/profiling")
+async def stop_profiling(user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    await db.profiling_sessions.update_one({"_id": "current"}, {"$set": {"armed": False}})
+    _apply_profiling_session(None)
+    
+    await log_audit("profiling", "requests", "disarmed", user)
+    
+    return await _profiling_status()
+
+@api_router.get("/admin/profiling")
+async def get_profiling_status(user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    return await _profiling_status()
+
+@api_router.get("/admin/profiling/{profile_id}")
+async def get_profile(profile_id: str, format: str = "speedscope",
+                      user: Dict = Depends(require_role([UserRole.ADMIN]))):
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    if format == "collapsed":
+        return PlainTextResponse(_profile_to_collapsed(profile))
+    if format == "speedscope":
+        return _profile_to_speedscope(profile)
+    raise HTTPException(status_code=400, detail="Format must be speedscope or collapsed")
 
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(ProfilingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -838,6 +2287,84 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # At most one open alert per key; repeats are folded into it by raise_alert
+    await migrate_legacy_alerts()
+    await db.alerts.create_index(
+        [("alert_type", 1), ("entity_type", 1), ("entity_id", 1)],
+        unique=True,
+        partialFilterExpression={"is_resolved": False}
+    )
+    await db.alerts.create_index([("is_resolved", 1), ("last_seen_at", -1)])
+    await db.business_config_changes.create_index("version", unique=True)
+    await db.switch_node_bundles.create_index("switch_node_id", unique=True)
+    await db.switch_node_bundle_changes.create_index([("switch_node_id", 1), ("version", 1)], unique=True)
+    await db.connections.create_index("id", unique=True)
+    for keys in CONNECTION_INDEXES:
+        await db.connections.create_index(keys)
+    existing = await db.connections.index_information()
+    kept = {"_".join(f"{field}_{direction}" for field, direction in keys) for keys in CONNECTION_INDEXES}
+    for field in LEGACY_CONNECTION_INDEX_FIELDS:
+        for sort_key in CONNECTION_SORT_KEYS:
+            name = f"{field}_1_{sort_key}_1"
+            if name in existing and name not in kept:
+                await db.connections.drop_index(name)
+    await db.endpoint_bindings.create_index([("ip_address", 1), ("port", 1)], unique=True)
+    await db.endpoint_bindings.create_index("registrations")
+    await db.request_profiles.create_index("id", unique=True)
+    await db.request_profiles.create_index("started_at")
+    await db.git_jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.git_jobs.create_index("id", unique=True)
+    await reconcile_switch_node_bundles()
+
+@app.on_event("startup")
+async def startup_endpoint_bindings():
+    await sync_endpoint_bindings()
+
+_profiling_watch_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_profiling_watch():
+    global _profiling_watch_task
+    _profiling_watch_task = asyncio.create_task(profiling_watch_loop())
+
+@app.on_event("shutdown")
+async def stop_profiling_watch():
+    if _profiling_watch_task:
+        _profiling_watch_task.cancel()
+
+_alert_flush_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_alert_flush():
+    global _alert_flush_task
+    _alert_flush_task = asyncio.create_task(alert_flush_loop())
+
+@app.on_event("shutdown")
+async def stop_alert_flush():
+    if _alert_flush_task:
+        _alert_flush_task.cancel()
+    # Write whatever the limiter is still holding
+    for state in _alert_rate_state.values():
+        state["written_at"] = float("-inf")
+    await flush_suppressed_alerts()
+
+_git_writer_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_git_writer():
+    global _git_writer_task
+    _git_writer_task = asyncio.create_task(git_writer_loop())
+
+@app.on_event("shutdown")
+async def stop_git_writer():
+    # Let an in-flight job finish before handing the working tree to the next leader
+    _git_writer_stopping.set()
+    if _git_writer_task:
+        await _git_writer_task
+    await release_git_writer_lease()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -49,6 +49,9 @@ const GitManagement = () => {
     try {
       const response = await axios.get(`${API_BASE}/git/files`);
       setConfigFiles(response.data.files);
+      if (response.data.truncated) {
+        toast.warning(`Showing the first ${response.data.files.length} files; the rest exceed the response size limit`);
+      }
     } catch (error) {
       console.error('Failed to fetch config files:', error);
     }
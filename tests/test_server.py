@@ -0,0 +1,568 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = f"toolbox_test_{uuid.uuid4().hex[:8]}"
+
+import server  # noqa: E402
+
+# Motor binds to the first event loop it runs on, so every test shares one
+LOOP = asyncio.new_event_loop()
+
+
+def run(coro):
+    return LOOP.run_until_complete(coro)
+
+
+def connection(ip="10.0.0.1", port=5000, nodes=(), name="ep"):
+    return {
+        "client_ip_address": ip,
+        "client_port": port,
+        "endpoint_name": name,
+        "connector_nodes": [{"ip_address": node_ip, "port": node_port} for node_ip, node_port in nodes],
+    }
+
+
+# Endpoint bindings (pure helpers)
+def test_connection_bindings_include_connector_nodes():
+    data = connection(nodes=[("10.0.0.2", 6000)])
+    assert server._connection_bindings(data) == [("10.0.0.1", 5000), ("10.0.0.2", 6000)]
+
+
+def test_duplicate_bindings_within_one_submission():
+    data = connection(nodes=[("10.0.0.1", 5000), ("10.0.0.3", 7000)])
+    conflicts = server._duplicate_bindings(server._connection_bindings(data))
+    assert conflicts == [{"ip_address": "10.0.0.1", "port": 5000, "used_by": "same submission"}]
+
+
+def test_import_file_conflicts_between_entries():
+    entries = [
+        connection(port=5000),
+        connection(port=5001),
+        connection(ip="10.0.0.9", nodes=[("10.0.0.1", 5000)]),
+    ]
+    conflicts = server._import_file_conflicts(entries)
+    assert list(conflicts) == [2]
+    assert conflicts[2] == [{"ip_address": "10.0.0.1", "port": 5000, "used_by": "import entry 0"}]
+
+
+def test_import_file_conflicts_clean_file():
+    assert server._import_file_conflicts([connection(port=5000), connection(port=5001)]) == {}
+
+
+def test_stale_registrations_respect_grace_period():
+    binding = {
+        "registrations": ["connection:a", "pending:old", "pending:new", "pending:legacy"],
+        "reserved_at": {"connection:a": "2026-01-01T00:00:00+00:00",
+                        "pending:old": "2026-01-01T00:00:00+00:00",
+                        "pending:new": "2026-01-01T00:10:00+00:00"},
+    }
+    stale = server._stale_registrations(binding, {"connection:a"}, "2026-01-01T00:05:00+00:00")
+    assert stale == ["pending:old", "pending:legacy"]
+
+
+# Endpoint bindings (Mongo)
+def _mongo_available():
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+requires_mongo = pytest.mark.skipif(not _mongo_available(), reason="MongoDB is not reachable")
+
+
+@pytest.fixture
+def bindings_db():
+    run(server.db.endpoint_bindings.create_index([("ip_address", 1), ("port", 1)], unique=True))
+    yield
+    run(server.client.drop_database(os.environ["DB_NAME"]))
+
+
+@requires_mongo
+def test_register_rejects_binding_held_by_another_entity(bindings_db):
+    assert run(server.register_endpoints("connection:a", "a", connection())) == []
+    conflicts = run(server.register_endpoints("pending:x", "pending:x", connection(nodes=[("10.0.0.5", 1)])))
+    assert conflicts == [{"ip_address": "10.0.0.1", "port": 5000, "used_by": "connection:a"}]
+    # Nothing from the rejected submission stays reserved
+    assert run(server.find_endpoint_conflicts(connection(ip="10.0.0.5", port=1))) == []
+
+
+@requires_mongo
+def test_update_reuses_its_own_bindings(bindings_db):
+    run(server.register_endpoints("connection:a", "a", connection()))
+    assert run(server.find_endpoint_conflicts(connection(), "a")) == []
+    assert run(server.register_endpoints("pending:u", "a", connection(nodes=[("10.0.0.2", 6000)]))) == []
+    # The connection's binding survives the pending update being withdrawn
+    run(server.unregister_endpoints("pending:u"))
+    assert run(server.find_endpoint_conflicts(connection(ip="10.0.0.2", port=6000))) == []
+    assert run(server.find_endpoint_conflicts(connection()))[0]["used_by"] == "connection:a"
+
+
+@requires_mongo
+def test_register_rejects_duplicates_within_submission(bindings_db):
+    conflicts = run(server.register_endpoints("pending:x", "pending:x",
+                                              connection(nodes=[("10.0.0.1", 5000)])))
+    assert conflicts == [{"ip_address": "10.0.0.1", "port": 5000, "used_by": "same submission"}]
+    assert run(server.find_endpoint_conflicts(connection())) == []
+
+
+@requires_mongo
+def test_unregister_and_transfer(bindings_db):
+    run(server.register_endpoints("pending:c", "pending:c", connection()))
+    run(server.transfer_endpoints("pending:c", "connection:new", "new"))
+    assert run(server.find_endpoint_conflicts(connection()))[0]["used_by"] == "connection:new"
+    run(server.unregister_endpoints("connection:new"))
+    assert run(server.find_endpoint_conflicts(connection())) == []
+
+
+@requires_mongo
+def test_validate_connections_reports_duplicates_inside_file(bindings_db):
+    base = {
+        "client_type": "acquiring", "connection_type": "client_listener", "client_node_id": "n1",
+        "client_port": 5000, "client_ip_address": "10.0.0.1", "heartbeat_prompt_type": "echo",
+        "heartbeat_interval": 30, "switch_node_id": "s1", "endpoint_name": "first", "timeout_interval": 30,
+    }
+    entries = [server.ConnectionCreate(**base), server.ConnectionCreate(**{**base, "endpoint_name": "second"})]
+    result = run(server.validate_connections(entries, user={}))
+    assert result["valid"] is False
+    assert result["conflicts"] == [{
+        "index": 1, "endpoint_name": "second",
+        "conflicts": [{"ip_address": "10.0.0.1", "port": 5000, "used_by": "import entry 0"}],
+    }]
+
+
+@requires_mongo
+def test_prune_keeps_recent_and_live_registrations(bindings_db):
+    run(server.register_endpoints("pending:orphan", "pending:orphan", connection(port=1)))
+    run(server.register_endpoints("pending:inflight", "pending:inflight", connection(port=2)))
+    run(server.register_endpoints("connection:live", "live", connection(port=3)))
+    run(server.db.connections.insert_one({"id": "live"}))
+    old = "2026-01-01T00:00:00+00:00"
+    for port, registration_id in ((1, "pending:orphan"), (3, "connection:live")):
+        run(server.db.endpoint_bindings.update_one({"port": port}, {"$set": {f"reserved_at.{registration_id}": old}}))
+    # Nothing is valid yet: "pending:inflight" is a change another worker has not inserted
+    assert run(server.prune_endpoint_registrations([])) == ["pending:orphan"]
+    assert run(server.find_endpoint_conflicts(connection(port=1))) == []
+    assert run(server.find_endpoint_conflicts(connection(port=2)))[0]["used_by"] == "pending:inflight"
+    assert run(server.find_endpoint_conflicts(connection(port=3)))[0]["used_by"] == "connection:live"
+
+
+# Alert deduplication
+@pytest.fixture
+def alert_writes(monkeypatch):
+    """Record limiter writes instead of sending them to Mongo."""
+    writes = []
+
+    async def write_alert(key, count, message, severity, last_seen_at):
+        writes.append((key, count, message))
+
+    monkeypatch.setattr(server, "_write_alert", write_alert)
+    monkeypatch.setattr(server, "_alert_rate_state", {})
+    return writes
+
+
+KEY = ("connection_down", "connection", "c1")
+
+
+def raise_down(message="down"):
+    return run(server.raise_alert(server.AlertType.CONNECTION_DOWN, "connection", "c1", message))
+
+
+def test_alert_limiter_suppresses_repeats_and_flushes_them(alert_writes, monkeypatch):
+    assert raise_down() is True
+    assert raise_down() is False
+    assert raise_down("still down") is False
+    assert alert_writes == [(KEY, 1, "down")]
+    # Window not over yet: nothing to flush
+    run(server.flush_suppressed_alerts())
+    assert len(alert_writes) == 1
+
+    monkeypatch.setattr(server, "ALERT_MIN_INTERVAL_SECONDS", 0)
+    run(server.flush_suppressed_alerts())
+    assert alert_writes[1] == (KEY, 2, "still down")
+    # A quiet key is forgotten on the next flush
+    run(server.flush_suppressed_alerts())
+    assert KEY not in server._alert_rate_state
+
+
+def test_alert_limiter_keeps_counts_when_write_fails(alert_writes, monkeypatch):
+    recording_write = server._write_alert
+    raise_down()
+    raise_down()
+
+    async def failing_write(*args):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(server, "ALERT_MIN_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(server, "_write_alert", failing_write)
+    with pytest.raises(RuntimeError):
+        raise_down()
+    run(server.flush_suppressed_alerts())
+    assert server._alert_rate_state[KEY]["pending"] == 2
+
+    monkeypatch.setattr(server, "_write_alert", recording_write)
+    run(server.flush_suppressed_alerts())
+    assert alert_writes[-1] == (KEY, 2, "down")
+
+
+def test_forget_alert_keys_reopens_alert(alert_writes):
+    raise_down()
+    server.forget_alert_keys([{"alert_type": KEY[0], "entity_type": KEY[1], "entity_id": KEY[2]}])
+    assert raise_down() is True
+    assert len(alert_writes) == 2
+
+
+@pytest.fixture
+def alerts_db(monkeypatch):
+    monkeypatch.setattr(server, "_alert_rate_state", {})
+    monkeypatch.setattr(server, "ALERT_MIN_INTERVAL_SECONDS", 0)
+    yield
+    run(server.client.drop_database(os.environ["DB_NAME"]))
+
+
+def create_alert_index():
+    run(server.db.alerts.create_index(
+        [("alert_type", 1), ("entity_type", 1), ("entity_id", 1)],
+        unique=True, partialFilterExpression={"is_resolved": False}
+    ))
+
+
+@requires_mongo
+def test_repeated_alert_increments_open_alert(alerts_db):
+    create_alert_index()
+    raise_down("first")
+    raise_down("second")
+    alerts = run(server.db.alerts.find({}, {"_id": 0}).to_list(None))
+    assert len(alerts) == 1
+    assert alerts[0]["occurrence_count"] == 2
+    assert alerts[0]["message"] == "second"
+
+
+@requires_mongo
+def test_migrate_legacy_alerts_merges_open_duplicates(alerts_db):
+    def legacy(alert_id, created_at, message, is_resolved=False):
+        return {"id": alert_id, "alert_type": KEY[0], "entity_type": KEY[1], "entity_id": KEY[2],
+                "message": message, "severity": "high", "is_resolved": is_resolved, "created_at": created_at}
+
+    run(server.db.alerts.insert_many([
+        legacy("a", "2026-01-01T00:00:00+00:00", "first"),
+        legacy("b", "2026-01-02T00:00:00+00:00", "latest"),
+        legacy("c", "2026-01-03T00:00:00+00:00", "old incident", is_resolved=True),
+    ]))
+    run(server.migrate_legacy_alerts())
+    create_alert_index()
+    open_alerts = run(server.db.alerts.find({"is_resolved": False}, {"_id": 0}).to_list(None))
+    assert len(open_alerts) == 1
+    assert open_alerts[0]["id"] == "a"
+    assert open_alerts[0]["occurrence_count"] == 2
+    assert open_alerts[0]["message"] == "latest"
+    assert open_alerts[0]["first_seen_at"] == "2026-01-01T00:00:00+00:00"
+    assert open_alerts[0]["last_seen_at"] == "2026-01-02T00:00:00+00:00"
+    assert run(server.db.alerts.count_documents({"id": "c", "occurrence_count": 1})) == 1
+
+
+# Business config snapshots
+SNAPSHOT = {"version": 3, "hash": "h3", "configs": {"fees": {"a": {"id": "1", "value": 1, "description": None}}}}
+
+
+def test_business_config_response_not_modified():
+    assert server._business_config_response(SNAPSHOT, 3).status_code == 304
+    # A version published through another worker that this one has not seen yet
+    assert server._business_config_response(SNAPSHOT, 4).status_code == 304
+
+
+def test_business_config_response_delta_or_full():
+    delta = server._business_config_response(SNAPSHOT, 1, [{"key": "a"}])
+    assert delta == {"type": "delta", "since_version": 1, "version": 3, "hash": "h3", "changes": [{"key": "a"}]}
+    assert server._business_config_response(SNAPSHOT, 1)["type"] == "full"
+    assert server._business_config_response(SNAPSHOT, None) == {
+        "type": "full", "version": 3, "hash": "h3", "configs": SNAPSHOT["configs"]
+    }
+
+
+@pytest.fixture
+def business_config_db(monkeypatch):
+    monkeypatch.setattr(server, "_business_config_snapshot",
+                        {"version": -1, "hash": None, "configs": {}, "checked_at": 0.0})
+    server.invalidate_cached_reads("business_config_changes")
+    yield
+    server.invalidate_cached_reads("business_config_changes")
+    run(server.client.drop_database(os.environ["DB_NAME"]))
+
+
+def snapshot_route(since_version=None, wait=0):
+    return run(server.get_business_config_snapshot_route(since_version, wait, user={}))
+
+
+@requires_mongo
+def test_business_config_delta_needs_every_version(business_config_db):
+    for key in ("a", "b", "c"):
+        run(server.publish_business_config_changes([{"op": "upsert", "key": key}]))
+    assert run(server.get_business_config_delta(1, 3)) == [{"op": "upsert", "key": "b"},
+                                                          {"op": "upsert", "key": "c"}]
+    run(server.db.business_config_changes.delete_many({"version": 1}))
+    assert run(server.get_business_config_delta(0, 3)) is None
+    assert snapshot_route(0)["type"] == "full"
+    assert snapshot_route(1)["type"] == "delta"
+    assert snapshot_route(3).status_code == 304
+
+
+@requires_mongo
+def test_business_config_long_poll_wakes_on_publish(business_config_db):
+    run(server.publish_business_config_changes([{"op": "upsert", "key": "a"}]))
+
+    async def scenario():
+        poll = asyncio.ensure_future(server.get_business_config_snapshot_route(1, 30, user={}))
+        await asyncio.sleep(0.05)
+        assert not poll.done()
+        started = asyncio.get_running_loop().time()
+        await server.publish_business_config_changes([{"op": "upsert", "key": "b"}])
+        response = await poll
+        return response, asyncio.get_running_loop().time() - started
+
+    response, waited = run(scenario())
+    assert response["type"] == "delta" and response["version"] == 2
+    assert waited < server.BUSINESS_CONFIG_VERSION_CHECK_SECONDS
+
+
+# Connection listing
+def test_get_connections_rejects_unknown_fields():
+    with pytest.raises(server.HTTPException) as excinfo:
+        run(server.get_connections(fields="endpoint_name,password", user={}))
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail == "Unknown fields: password"
+
+
+def test_get_connections_rejects_unindexed_sort():
+    with pytest.raises(server.HTTPException) as excinfo:
+        run(server.get_connections(sort="-client_port", user={}))
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail.startswith("Cannot sort by -client_port")
+
+
+@pytest.fixture
+def connections_db():
+    run(server.db.connections.insert_many([
+        {"id": "1", "endpoint_name": "visa.primary", "client_type": "acquiring", "switch_node_id": "s1",
+         "updated_at": "2026-01-03T00:00:00+00:00"},
+        {"id": "2", "endpoint_name": "visaXprimary", "client_type": "issuing", "switch_node_id": "s1",
+         "updated_at": "2026-01-01T00:00:00+00:00"},
+        {"id": "3", "endpoint_name": "amex", "client_type": "acquiring", "switch_node_id": "s2",
+         "updated_at": "2026-01-02T00:00:00+00:00"},
+    ]))
+    yield
+    run(server.client.drop_database(os.environ["DB_NAME"]))
+
+
+def list_connections(**params):
+    return run(server.get_connections(user={}, fields="endpoint_name", **params))
+
+
+@requires_mongo
+def test_get_connections_filters_and_sorts(connections_db):
+    acquiring = list_connections(client_type=server.ClientType.ACQUIRING, sort="endpoint_name")
+    assert [conn["endpoint_name"] for conn in acquiring] == ["amex", "visa.primary"]
+    recent = list_connections(switch_node_id="s1", sort="-updated_at")
+    assert [conn["id"] for conn in recent] == ["1", "2"]
+
+
+@requires_mongo
+def test_get_connections_prefix_search_is_literal(connections_db):
+    assert [conn["id"] for conn in list_connections(endpoint_name="visa.")] == ["1"]
+    assert list_connections(endpoint_name="primary") == []
+
+
+@requires_mongo
+def test_get_connections_projection_keeps_id(connections_db):
+    assert list_connections(endpoint_name="amex") == [{"id": "3", "endpoint_name": "amex"}]
+
+
+# Switch node bundles (Mongo)
+@pytest.fixture
+def bundles_db():
+    run(server.db.switch_node_bundles.create_index("switch_node_id", unique=True))
+    run(server.db.switch_node_bundle_changes.create_index([("switch_node_id", 1), ("version", 1)], unique=True))
+    yield
+    run(server.client.drop_database(os.environ["DB_NAME"]))
+
+
+def bundle(switch_node_id, since_version=None):
+    return run(server.get_switch_node_bundle(switch_node_id, since_version, user={}))
+
+
+@requires_mongo
+def test_bundle_delta_full_and_not_modified(bundles_db):
+    run(server.apply_switch_node_bundle_change("s1", "a", {"id": "a", "endpoint_name": "a"}))
+    run(server.apply_switch_node_bundle_change("s1", "b", {"id": "b", "endpoint_name": "b"}))
+
+    full = bundle("s1")
+    assert full["type"] == "full" and full["version"] == 2
+    assert sorted(conn["id"] for conn in full["connections"]) == ["a", "b"]
+
+    delta = bundle("s1", 1)
+    assert delta["type"] == "delta"
+    assert [(change["version"], change["op"], change["connection_id"]) for change in delta["changes"]] == [
+        (2, "upsert", "b")
+    ]
+    assert bundle("s1", 2).status_code == 304
+    # A version the client cannot have seen gets the full bundle
+    assert bundle("s1", 7)["type"] == "full"
+
+
+@requires_mongo
+def test_bundle_falls_back_to_full_when_changes_are_missing(bundles_db):
+    run(server.apply_switch_node_bundle_change("s1", "a", {"id": "a"}))
+    run(server.apply_switch_node_bundle_change("s1", "b", {"id": "b"}))
+    run(server.db.switch_node_bundle_changes.delete_many({"version": 1}))
+    assert bundle("s1", 0)["type"] == "full"
+    assert bundle("s1", 1)["type"] == "delta"
+
+
+@requires_mongo
+def test_bundle_connection_moves_between_nodes(bundles_db):
+    run(server.apply_switch_node_bundle_change("s1", "a", {"id": "a"}))
+    run(server.apply_switch_node_bundle_change("s1", "a"))
+    run(server.apply_switch_node_bundle_change("s2", "a", {"id": "a", "switch_node_id": "s2"}))
+    assert bundle("s1")["connections"] == []
+    assert bundle("s1", 1)["changes"][0]["op"] == "delete"
+    assert bundle("s2")["connections"] == [{"id": "a", "switch_node_id": "s2"}]
+
+
+@requires_mongo
+def test_reconcile_rebuilds_only_when_bundle_disagrees(bundles_db):
+    run(server.db.connections.insert_one({"id": "a", "switch_node_id": "s1"}))
+    assert run(server.reconcile_switch_node_bundle("s1")) is True
+    assert bundle("s1") == {"type": "full", "switch_node_id": "s1", "version": 1,
+                            "connections": [{"id": "a", "switch_node_id": "s1"}]}
+    assert run(server.reconcile_switch_node_bundle("s1")) is False
+
+    run(server.db.connections.insert_one({"id": "b", "switch_node_id": "s1"}))
+    assert run(server.reconcile_switch_node_bundles()) == ["s1"]
+    rebuilt = bundle("s1", 1)
+    # No change record for the rebuild, so clients get the full bundle
+    assert rebuilt["type"] == "full" and rebuilt["version"] == 2
+    assert len(rebuilt["connections"]) == 2
+
+
+# Single-flight read cache
+def test_cached_read_shares_inflight_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(calls)}
+
+    async def scenario():
+        return await asyncio.gather(*(server.cached_read("test_shared", ("k",), compute) for _ in range(5)))
+
+    results = run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    server.invalidate_cached_reads("test_shared")
+
+
+def test_cached_read_skips_results_invalidated_mid_flight():
+    calls = []
+    release = asyncio.Event()
+
+    async def compute():
+        calls.append(1)
+        await release.wait()
+        return len(calls)
+
+    async def scenario():
+        first = asyncio.ensure_future(server.cached_read("test_invalidate", ("k",), compute))
+        await asyncio.sleep(0)
+        server.invalidate_cached_reads("test_invalidate")
+        release.set()
+        stale = await first
+        fresh = await server.cached_read("test_invalidate", ("k",), compute)
+        cached = await server.cached_read("test_invalidate", ("k",), compute)
+        return stale, fresh, cached
+
+    assert run(scenario()) == (1, 2, 2)
+    assert len(calls) == 2
+    server.invalidate_cached_reads("test_invalidate")
+
+
+# Profile output
+PROFILE = {
+    "method": "GET",
+    "path": "/api/dashboard/stats",
+    "started_at": "2026-01-01T00:00:00+00:00",
+    "interval_ms": 5.0,
+    "stacks": [
+        {"frames": ["handler (server.py:1)", "count (motor.py:2)"], "count": 3},
+        {"frames": ["handler (server.py:1)"], "count": 1},
+    ],
+}
+
+
+def test_profile_to_collapsed():
+    assert server._profile_to_collapsed(PROFILE) == (
+        "handler (server.py:1);count (motor.py:2) 3\n"
+        "handler (server.py:1) 1"
+    )
+
+
+def test_profile_to_speedscope():
+    speedscope = server._profile_to_speedscope(PROFILE)
+    assert speedscope["shared"]["frames"] == [{"name": "handler (server.py:1)"}, {"name": "count (motor.py:2)"}]
+    profile = speedscope["profiles"][0]
+    assert profile["samples"] == [[0, 1], [0]]
+    assert profile["weights"] == [15.0, 5.0]
+    assert profile["endValue"] == 20.0
+    assert profile["name"] == "GET /api/dashboard/stats"
+
+
+# Git reads
+def test_git_read_files_stops_at_size_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "GIT_REPO_PATH", tmp_path)
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.json").write_text('{"value": "xxxxxxxx"}')
+    size = (tmp_path / "a.json").stat().st_size
+    result = server.git_read_files(max_bytes=2 * size)
+    assert result["truncated"] is True
+    assert [entry["connection_id"] for entry in result["files"]] == ["a", "b"]
+    assert server.git_read_files()["truncated"] is False
+
+
+# Request profiling
+def test_profiling_poll_backs_off_while_disarmed(monkeypatch):
+    monkeypatch.setattr(server, "_profiling_armed", False)
+    delays = [server.PROFILING_POLL_SECONDS]
+    for _ in range(8):
+        delays.append(server._next_profiling_poll_delay(delays[-1]))
+    assert delays[:4] == [1.0, 2.0, 4.0, 8.0]
+    assert delays[-1] == server.PROFILING_IDLE_POLL_SECONDS
+    monkeypatch.setattr(server, "_profiling_armed", True)
+    assert server._next_profiling_poll_delay(delays[-1]) == server.PROFILING_POLL_SECONDS
+
+
+def test_profiling_middleware_serves_unprofiled_when_claim_fails(monkeypatch):
+    async def failing_claim():
+        raise RuntimeError("database unavailable")
+
+    served = []
+
+    async def app(scope, receive, send):
+        served.append(scope["path"])
+
+    monkeypatch.setattr(server, "_profiling_armed", True)
+    monkeypatch.setitem(server._profiling_state, "pattern", server.re.compile("^/api/"))
+    monkeypatch.setattr(server, "_claim_profiling_slot", failing_claim)
+    middleware = server.ProfilingMiddleware(app)
+    run(middleware({"type": "http", "method": "GET", "path": "/api/connections"}, None, None))
+    assert served == ["/api/connections"]
+    assert server._active_profiles == {}